@@ -0,0 +1,325 @@
+"""asyncio BlobStash client, requires `aiohttp` (`pip install blobstash[async]`)."""
+import asyncio
+import os
+import time
+from urllib.parse import urljoin
+
+import aiohttp
+
+from blobstash.base.blobstore import Blob
+from blobstash.base.blobstore import BlobNotFoundError
+from blobstash.base.blobstore import BlobsIterator
+from blobstash.base.client import DEFAULT_BASE_URL
+from blobstash.base.codec import get_codec
+from blobstash.base.kvstore import KeyNotFoundError
+from blobstash.base.kvstore import KeysIterator
+from blobstash.base.kvstore import KeyValue
+from blobstash.base.kvstore import KeyVersionsIterator
+from blobstash.base.unixsocket import UNIX_ROOT_URL
+from blobstash.base.unixsocket import socket_path
+
+DEFAULT_LIMIT = 100
+
+
+class AsyncClient:
+    """Basic asyncio client for API-specific client to build upon.
+
+    The underlying `aiohttp.ClientSession` (and its connections pool) is created on the first request and must be
+    released with `close` (or by using the client as an async context manager). `limit` caps the total number of
+    connections and `limit_per_host` the number of connections per host (0 means no limit). Like `Client`, the base_url
+    can be a `unix:///path/to/blobstash.sock` URL, and it supports the same `codec`, `metrics`, `retry` and
+    `hedge` options.
+
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        api_key=None,
+        json_encoder=None,
+        codec=None,
+        limit=DEFAULT_LIMIT,
+        limit_per_host=0,
+        metrics=None,
+        retry=None,
+        hedge=None,
+    ):
+        self.base_url = base_url or os.getenv("BLOBSTASH_BASE_URL", DEFAULT_BASE_URL)
+        self.api_key = api_key or os.getenv("BLOBSTASH_API_KEY")
+        self.json_encoder = json_encoder
+        self.codec = codec or get_codec(json_encoder)
+        self.metrics = metrics
+        self.retry = retry
+        self.hedge = hedge
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._socket_path = socket_path(self.base_url)
+        self._root_url = UNIX_ROOT_URL if self._socket_path else self.base_url
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            if self._socket_path:
+                connector = aiohttp.UnixConnector(
+                    path=self._socket_path, limit=self.limit
+                )
+            else:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit, limit_per_host=self.limit_per_host
+                )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """Close the session and release the connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def request(self, verb: str, path: str, **kwargs):
+        """Helper for making authenticated request to BlobStash.
+
+        With `raw=True`, the response is returned as is, and its body is already read unless `stream=True` is passed
+        (it's then up to the caller to `release` it).
+
+        """
+        raw = kwargs.pop("raw", False)
+        stream = kwargs.pop("stream", False)
+        json_data = kwargs.pop("json", None)
+        if json_data:
+            kwargs["data"] = self.codec.dumps(json_data)
+            headers = kwargs.get("headers", {})
+            headers["Content-Type"] = "application/json"
+            kwargs["headers"] = headers
+
+        # Unlike requests, aiohttp does not skip the `None` params
+        params = kwargs.pop("params", None)
+        if params:
+            kwargs["params"] = {k: v for k, v in params.items() if v is not None}
+
+        if self.api_key:
+            kwargs["auth"] = aiohttp.BasicAuth("", self.api_key)
+
+        if self.retry is None:
+            resp = await self._attempt(verb, path, stream, **kwargs)
+        else:
+            resp = await self._retried_request(verb, path, stream, **kwargs)
+        if raw:
+            return resp
+
+        try:
+            resp.raise_for_status()
+            if resp.status != 204:
+                return self.codec.loads(await resp.read())
+        finally:
+            resp.release()
+
+    async def _retried_request(self, verb, path, stream, **kwargs):
+        attempt = 1
+        while 1:
+            try:
+                resp = await self._attempt(verb, path, stream, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not self.retry.should_retry(verb, attempt):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+            else:
+                if resp.status not in self.retry.status_codes:
+                    return resp
+                if not self.retry.should_retry(verb, attempt):
+                    return resp
+                resp.release()
+                await asyncio.sleep(
+                    self.retry.delay(attempt, resp.headers.get("Retry-After"))
+                )
+
+            attempt += 1
+
+    async def _attempt(self, verb, path, stream, **kwargs):
+        if self.hedge is not None and verb == "GET" and not stream:
+            start = time.perf_counter()
+            resp = await self.hedge.run_async(
+                lambda: self._send(verb, path, stream, **kwargs)
+            )
+            self.hedge.observe(time.perf_counter() - start)
+            return resp
+
+        return await self._send(verb, path, stream, **kwargs)
+
+    async def _send(self, verb, path, stream, **kwargs):
+        if self.metrics is not None:
+            return await self._observed_request(verb, path, stream, **kwargs)
+
+        resp = await self.session.request(verb, urljoin(self._root_url, path), **kwargs)
+        if not stream:
+            await resp.read()
+        return resp
+
+    async def _observed_request(self, verb, path, stream, **kwargs):
+        from blobstash.base.metrics import body_size
+
+        start = time.perf_counter()
+        try:
+            resp = await self.session.request(
+                verb, urljoin(self._root_url, path), **kwargs
+            )
+            if stream:
+                response_bytes = resp.content_length or 0
+            else:
+                response_bytes = len(await resp.read())
+        except Exception:
+            self.metrics.observe(verb, path, "error", time.perf_counter() - start)
+            raise
+
+        self.metrics.observe(
+            verb,
+            path,
+            resp.status,
+            time.perf_counter() - start,
+            request_bytes=body_size(kwargs.get("data")),
+            response_bytes=response_bytes,
+        )
+        return resp
+
+
+class AsyncPaginationMixin:
+    """Turns a `BasePaginationIterator` subclass into an async iterator (to be used with `async for`).
+
+    `checkpoint`/`resume_from` are supported (the checkpoint is saved each time a page is fully consumed), but not
+    `stream` and `prefetch` (`ValueError` is raised).
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.stream or self.prefetch:
+            raise ValueError(
+                "stream and prefetch are not supported by {}".format(
+                    type(self).__name__
+                )
+            )
+
+    async def do_req(self, cursor=None):
+        if cursor is None:
+            cursor = self.cursor
+        return await self._client.request(
+            "GET", self.path, params=self.page_params(cursor)
+        )
+
+    def __iter__(self):
+        raise TypeError("{} must be used with `async for`".format(type(self).__name__))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while 1:
+            if self.limit and self._returned == self.limit:
+                raise StopAsyncIteration
+            if self.items:
+                self._returned += 1
+                return self.items.popleft()
+            if self.checkpoint is not None:
+                self.save_checkpoint()
+            if not self.has_more:
+                raise StopAsyncIteration
+            resp = await self.do_req()
+            self.parse_resp(resp)
+
+
+class AsyncBlobsIterator(AsyncPaginationMixin, BlobsIterator):
+    pass
+
+
+class AsyncKeysIterator(AsyncPaginationMixin, KeysIterator):
+    pass
+
+
+class AsyncKeyVersionsIterator(AsyncPaginationMixin, KeyVersionsIterator):
+    pass
+
+
+class AsyncBlobStoreClient:
+    def __init__(self, base_url=None, api_key=None, client=None):
+        if client:
+            self._client = client
+            return
+
+        self._client = AsyncClient(base_url=base_url, api_key=api_key)
+
+    async def close(self):
+        await self._client.close()
+
+    async def put(self, blob):
+        data = aiohttp.FormData()
+        data.add_field(blob.hash, blob.data, filename=blob.hash)
+        resp = await self._client.request(
+            "POST", "/api/blobstore/upload", data=data, raw=True
+        )
+        resp.raise_for_status()
+
+    async def get(self, hash):
+        resp = await self._client.request(
+            "GET", "/api/blobstore/blob/{}".format(hash), raw=True
+        )
+        if resp.status == 404:
+            raise BlobNotFoundError
+        resp.raise_for_status()
+        return Blob(hash, await resp.read())
+
+    def iter(self, cursor=None, limit=None, per_page=None, **kwargs):
+        return AsyncBlobsIterator(
+            self._client, cursor=cursor, limit=limit, per_page=per_page, **kwargs
+        )
+
+    def __aiter__(self):
+        return AsyncBlobsIterator(self._client)
+
+
+class AsyncKVStoreClient:
+    def __init__(self, base_url=None, api_key=None, client=None):
+        if client:
+            self._client = client
+            return
+
+        self._client = AsyncClient(base_url=base_url, api_key=api_key)
+
+    async def close(self):
+        await self._client.close()
+
+    async def put(self, key, data, ref="", version=-1):
+        return KeyValue(
+            **await self._client.request(
+                "POST",
+                "/api/kvstore/key/" + key,
+                data=dict(data=data, ref=ref, version=version),
+            )
+        )
+
+    async def get(self, key, version=None):
+        try:
+            return KeyValue(
+                **await self._client.request("GET", "/api/kvstore/key/" + key)
+            )
+        except aiohttp.ClientResponseError as error:
+            if error.status == 404:
+                raise KeyNotFoundError
+            raise
+
+    def get_versions(self, key, cursor=None, limit=None):
+        if isinstance(key, KeyValue):
+            key = key.key
+        return AsyncKeyVersionsIterator(self._client, key, cursor=cursor, limit=limit)
+
+    def iter(self, cursor=None, limit=None, **kwargs):
+        return AsyncKeysIterator(self._client, cursor=cursor, limit=limit, **kwargs)
+
+    def __aiter__(self):
+        return AsyncKeysIterator(self._client)
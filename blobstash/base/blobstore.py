@@ -1,9 +1,17 @@
+import binascii
+import io
+import os
+import time
+from collections import Counter
 from hashlib import blake2b
 
 from requests import HTTPError
 
+from blobstash.base.cache import blob_hash
+from blobstash.base.client import DEFAULT_TIMEOUT
 from blobstash.base.client import Client
 from blobstash.base.error import BlobStashError
+from blobstash.base.iterator import STREAM_CHUNK_SIZE
 from blobstash.base.iterator import BasePaginationIterator
 
 
@@ -15,19 +23,43 @@ class BlobNotFoundError(BlobStoreError):
     """Error raised when a blob is not found."""
 
 
+class MissingBlobsError(BlobNotFoundError):
+    """Error raised by `BlobStoreClient.get_many` when some blobs are not found (listed in `hashes`)."""
+
+    def __init__(self, hashes):
+        self.hashes = hashes
+        super().__init__("{} blob(s) not found".format(len(hashes)))
+
+
+class BlobHashMismatchError(BlobStoreError):
+    """Error raised when the content of a blob doesn't match its hash."""
+
+    def __init__(self, hash, actual_hash):
+        self.hash = hash
+        self.actual_hash = actual_hash
+        super().__init__("blob {} content hash is {}".format(hash, actual_hash))
+
+
+def _nbytes(data):
+    """Returns the size in bytes of the given bytes-like object (`len` is the number of items for a `memoryview`)."""
+    if isinstance(data, (bytes, bytearray, str)):
+        return len(data)
+    return memoryview(data).nbytes
+
+
 class Blob:
+    """Blob (and its hash), `data` can be any bytes-like object (e.g. a `memoryview` or an `mmap`), it's not copied."""
+
     def __init__(self, hash, data=None, size=None):
         self.hash = hash
-        self.data = data or ""
+        self.data = data if data is not None else ""
         self.size = size
         if not self.size and self.data:
-            self.size = len(self.data)
+            self.size = _nbytes(self.data)
 
     @classmethod
     def from_data(cls, data):
-        h = blake2b(digest_size=32)
-        h.update(data)
-        return cls(h.hexdigest(), data)
+        return cls(blob_hash(data), data)
 
     def __hash__(self):
         return hash(self.hash)
@@ -50,50 +82,748 @@ class Blob:
         return self.__repr__()
 
 
+class BlobRef:
+    """Lightweight reference to a stored blob (its hash and size), yielded by the compact listing."""
+
+    __slots__ = ("hash", "size")
+
+    def __init__(self, hash, size):
+        self.hash = hash
+        self.size = size
+
+    @property
+    def digest(self):
+        """Returns the binary hash."""
+        return bytes.fromhex(self.hash)
+
+    def __hash__(self):
+        return hash(self.hash)
+
+    def __eq__(self, other):
+        if not isinstance(other, self.__class__):
+            return False
+
+        return self.hash == other.hash
+
+    def __repr__(self):
+        return "BlobRef(hash={}, size={})".format(self.hash, self.size)
+
+
+class MultipartBody:
+    """Streamed `multipart/form-data` body for a batch of blobs (one part per blob, named after its hash, like
+    `requests` encodes a `files` dict).
+
+    The parts are generated while the body is sent, the blobs data is never copied into a single buffer, and since the
+    size is known upfront the body is sent with a `Content-Length` (not chunked). Each iteration restarts the body from
+    the beginning, so the request can be retried.
+
+    """
+
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.boundary = _new_boundary()
+        self.content_type = "multipart/form-data; boundary={}".format(self.boundary)
+        self.content_length = len(_closing(self.boundary)) + sum(
+            len(_part_header(self.boundary, blob.hash)) + _nbytes(blob.data) + 2
+            for blob in blobs
+        )
+
+    def __iter__(self):
+        for blob in self.blobs:
+            yield _part_header(self.boundary, blob.hash)
+            yield blob.data
+            yield b"\r\n"
+        yield _closing(self.boundary)
+
+    def __len__(self):
+        return self.content_length
+
+
+class MultipartStream:
+    """Streamed `multipart/form-data` body for a single blob read from an iterable of chunks, it can only be sent once.
+
+    With `size` (the blob size), the body is sent with a `Content-Length`, otherwise it's chunked.
+
+    """
+
+    def __init__(self, hash, chunks, size=None):
+        self.hash = hash
+        self.boundary = _new_boundary()
+        self.content_type = "multipart/form-data; boundary={}".format(self.boundary)
+        self.content_length = None
+        if size is not None:
+            self.content_length = (
+                len(_part_header(self.boundary, hash))
+                + size
+                + 2
+                + len(_closing(self.boundary))
+            )
+        self._chunks = chunks
+
+    def __iter__(self):
+        yield _part_header(self.boundary, self.hash)
+        yield from self._chunks
+        yield b"\r\n"
+        yield _closing(self.boundary)
+
+    def body(self):
+        """Returns the body to send (the stream itself if the size is known, or a generator to send it chunked)."""
+        if self.content_length is None:
+            return iter(self)
+        return self
+
+    def __len__(self):
+        return self.content_length
+
+
+def _new_boundary():
+    return binascii.hexlify(os.urandom(16)).decode()
+
+
+def _part_header(boundary, hash):
+    return (
+        "--{0}\r\n"
+        'Content-Disposition: form-data; name="{1}"; filename="{1}"\r\n'
+        "\r\n".format(boundary, hash).encode()
+    )
+
+
+def _closing(boundary):
+    return "--{}--\r\n".format(boundary).encode()
+
+
+def _read_chunks(src, chunk_size, hasher):
+    """Yield the chunks of the given file (or iterable of chunks), and update `hasher` on the fly."""
+    if hasattr(src, "readinto"):
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while 1:
+            n = src.readinto(buf)
+            if not n:
+                return
+            chunk = view[:n]
+            hasher.update(chunk)
+            # The buffer is reused, the chunk must be sent before reading the next one
+            yield chunk
+    elif hasattr(src, "read"):
+        while 1:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                return
+            hasher.update(chunk)
+            yield chunk
+    else:
+        for chunk in src:
+            hasher.update(chunk)
+            yield chunk
+
+
+def _stream_size(src):
+    """Returns the number of bytes left in the given file, or `None` if it's unknown (e.g. a pipe or an iterable)."""
+    try:
+        if not src.seekable():
+            return None
+        pos = src.tell()
+        end = src.seek(0, io.SEEK_END)
+        src.seek(pos)
+        return end - pos
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+class BatchStats:
+    """Stats of a batch uploaded by `BlobStoreClient.put_many`."""
+
+    def __init__(self, count, size, seconds):
+        self.count = count
+        self.size = size
+        self.seconds = seconds
+
+    @property
+    def blobs_per_second(self):
+        return self.count / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self):
+        return self.size / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return "blobstash.base.blobstore.BatchStats(count={!r}, size={!r}, seconds={:.3f}, MB/s={:.2f})".format(
+            self.count, self.size, self.seconds, self.bytes_per_second / 1e6
+        )
+
+
+def _batches(blobs, max_count, max_bytes):
+    """Group the blobs in lists of at most `max_count` blobs and `max_bytes` bytes (a bigger blob is sent alone)."""
+    batch = []
+    size = 0
+    for blob in blobs:
+        blob_size = _nbytes(blob.data)
+        if batch and (len(batch) == max_count or size + blob_size > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(blob)
+        size += blob_size
+
+    if batch:
+        yield batch
+
+
 class BlobsIterator(BasePaginationIterator):
-    def __init__(self, client, **kwargs):
-        super().__init__(client=client, path="/api/blobstore/blobs", **kwargs)
+    """Iterate over the stored blobs (without their data), as `BlobRef` with `compact`, or as `Blob`."""
 
-    def parse_data(self, resp):
-        raw_blobs = resp["data"]
-        blobs = []
-        for blob in raw_blobs:
-            blobs.append(Blob(**blob))
+    def __init__(self, client, compact=False, **kwargs):
+        self.compact = compact
+        super().__init__(client=client, path="/api/blobstore/blobs", **kwargs)
 
-        return blobs
+    def parse_item(self, item, resp):
+        if self.compact:
+            return BlobRef(item["hash"], item["size"])
+        return Blob(**item)
 
 
 class BlobStoreClient:
-    def __init__(self, base_url=None, api_key=None, client=None):
+    """BlobStore API client.
+
+    `known` is an optional set of the hashes known to be stored (a `set`, or a `blobstash.base.bloom.BloomFilter` to
+    keep it small), it's updated by `put`, `put_many` and `has_many`, and can be seeded with `seed_known`. With
+    `skip_known`, the uploads of known blobs are skipped, and `has_many` doesn't check them. A Bloom filter has false
+    positives (about its `error_rate`): a blob wrongly reported as known is never uploaded, only use it with
+    `skip_known` if this risk is acceptable (e.g. the blob will be uploaded again later anyway).
+
+    `cache` is an optional read-through cache for `get` (e.g. a `blobstash.base.cache.BlobCache`), only the blobs
+    matching their hash are added to it.
+
+    With `verify` (`True`, or a `blobstash.base.verify.HashVerifier`), the content of the fetched blobs is checked
+    against their hash, and `BlobHashMismatchError` is raised on mismatch. `get` hashes the blobs bigger than the
+    verifier `batch_bytes` in its thread pool, and `get_many` verifies the blobs in batches, in parallel with the next
+    downloads.
+
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        api_key=None,
+        client=None,
+        known=None,
+        cache=None,
+        verify=None,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.known = known
+        self.cache = cache
+        if verify is True:
+            from blobstash.base.verify import HashVerifier
+
+            verify = HashVerifier()
+        self.verifier = verify or None
         if client:
             self._client = client
             return
 
-        self._client = Client(base_url=base_url, api_key=api_key)
+        self._client = Client(base_url=base_url, api_key=api_key, timeout=timeout)
+
+    def _add_known(self, hashes):
+        if self.known is not None:
+            for hash in hashes:
+                self.known.add(hash)
+
+    def seed_known(self, **kwargs):
+        """Add the hashes of all the stored blobs to `known` (`kwargs` are passed to `iter`), returns the number of
+        blobs scanned."""
+        if self.known is None:
+            raise ValueError("no known set configured")
+        count = 0
+        for blobs in self.iter(**kwargs).iter_pages():
+            self._add_known(blob.hash for blob in blobs)
+            count += len(blobs)
+        return count
 
-    def put(self, blob):
+    def put(self, blob, skip_known=False):
+        if skip_known and self.known is not None and blob.hash in self.known:
+            return
         files = {blob.hash: blob.data}
         resp = self._client.request(
             "POST", "/api/blobstore/upload", files=files, raw=True
         )
         resp.raise_for_status()
+        self._add_known([blob.hash])
+
+    def put_stream(self, hash, src, size=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Upload a blob read from `src` (a binary file, or an iterable of bytes-like chunks) without loading it in
+        memory.
+
+        The content is hashed on the fly and `BlobHashMismatchError` is raised if it doesn't match `hash` (the server
+        rejects the blob too). With `hash` set to `None`, a seekable file is read twice: once to compute the hash,
+        then to upload it. `size` is only needed to avoid a chunked upload when the size of `src` cannot be guessed.
+
+        """
+        if hash is None:
+            pos = src.tell()
+            hasher = blake2b(digest_size=32)
+            for _ in _read_chunks(src, chunk_size, hasher):
+                pass
+            hash = hasher.hexdigest()
+            src.seek(pos)
+
+        if size is None:
+            size = _stream_size(src)
+        hasher = blake2b(digest_size=32)
+        body = MultipartStream(hash, _read_chunks(src, chunk_size, hasher), size)
+        resp = self._client.request(
+            "POST",
+            "/api/blobstore/upload",
+            data=body.body(),
+            headers={"Content-Type": body.content_type},
+            raw=True,
+        )
+        actual_hash = hasher.hexdigest()
+        if actual_hash != hash:
+            raise BlobHashMismatchError(hash, actual_hash)
+        resp.raise_for_status()
+        self._add_known([hash])
+        return hash
+
+    def put_chunked(self, src, chunker=None, skip_existing=False, **kwargs):
+        """Split `src` (a binary file or a bytes-like object) in content-defined chunks (see
+        `blobstash.base.chunker.FastCDC`), upload them with `put_many` (`kwargs` are passed to it), followed by the
+        manifest blob listing them, and returns the manifest hash (to be used with `get_chunked`).
+
+        The unchanged chunks of a new version of the same object have the same hash: they're skipped when known (with
+        `skip_known`), or after checking the server (with `skip_existing`, a `HEAD` request per chunk).
+
+        """
+        from blobstash.base.chunker import Manifest
+        from blobstash.base.chunker import chunk_blobs
+
+        chunks = []
+        seen = set()
+
+        def blobs():
+            for blob in chunk_blobs(src, chunker):
+                chunks.append((blob.hash, blob.size))
+                if blob.hash not in seen:
+                    seen.add(blob.hash)
+                    yield blob
+
+        new_blobs = blobs()
+        if skip_existing:
+            new_blobs = self._missing(new_blobs, kwargs.get("max_count", 256))
+        self.put_many(new_blobs, **kwargs)
+
+        manifest = Manifest(chunks).to_blob()
+        self.put(manifest)
+        return manifest.hash
+
+    def _missing(self, blobs, batch_size):
+        """Yield the blobs not stored yet, checked by batches of `batch_size` blobs."""
+        batch = []
+        for blob in blobs:
+            batch.append(blob)
+            if len(batch) == batch_size:
+                yield from self._missing_batch(batch)
+                batch = []
+        yield from self._missing_batch(batch)
+
+    def _missing_batch(self, blobs):
+        if not blobs:
+            return []
+        # Always ask the server, a `known` false positive would leave the manifest pointing to a missing chunk
+        existing = self.has_many((blob.hash for blob in blobs), skip_known=False)
+        return [blob for blob in blobs if blob.hash not in existing]
+
+    def put_many(
+        self,
+        blobs,
+        max_count=256,
+        max_bytes=8 * 1024 * 1024,
+        concurrency=1,
+        on_batch=None,
+        skip_known=False,
+    ):
+        """Upload the blobs (any iterable) using one multipart request per batch of at most `max_count` blobs and
+        `max_bytes` bytes, instead of one request per blob.
+
+        Up to `concurrency` batches are sent in parallel, and only these (plus as many waiting to be sent) are kept in
+        memory. `on_batch(stats)` is called with the `BatchStats` of each batch once uploaded, and the list of the
+        stats is returned (in completion order). With `skip_known`, the blobs in `known` are skipped.
+
+        """
+        stats = []
+
+        def upload(batch):
+            body = MultipartBody(batch)
+            start = time.perf_counter()
+            resp = self._client.request(
+                "POST",
+                "/api/blobstore/upload",
+                data=body,
+                headers={"Content-Type": body.content_type},
+                raw=True,
+            )
+            resp.raise_for_status()
+            self._add_known(blob.hash for blob in batch)
+            batch_stats = BatchStats(
+                len(batch), body.content_length, time.perf_counter() - start
+            )
+            stats.append(batch_stats)
+            if on_batch is not None:
+                on_batch(batch_stats)
+
+        if skip_known and self.known is not None:
+            known = self.known
+            blobs = (blob for blob in blobs if blob.hash not in known)
+        batches = _batches(blobs, max_count, max_bytes)
+        if concurrency <= 1:
+            for batch in batches:
+                upload(batch)
+            return stats
+
+        from concurrent.futures import FIRST_COMPLETED
+        from concurrent.futures import ThreadPoolExecutor
+        from concurrent.futures import wait
+
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="blobstash-put-many"
+        ) as executor:
+            pending = set()
+            try:
+                for batch in batches:
+                    if len(pending) >= 2 * concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    pending.add(executor.submit(upload, batch))
+                for future in pending:
+                    future.result()
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        return stats
+
+    def has(self, hash):
+        """Returns `True` if the blob is stored (without downloading it)."""
+        resp = self._client.request(
+            "HEAD", "/api/blobstore/blob/{}".format(hash), raw=True
+        )
+        if resp.status_code == 404:
+            return False
+        resp.raise_for_status()
+        self._add_known([hash])
+        return True
+
+    def has_many(self, hashes, concurrency=8, skip_known=False):
+        """Returns the set of the given hashes that are stored.
+
+        Each hash is checked with a `HEAD` request (up to `concurrency` in parallel), except the ones in `known` (with
+        `skip_known`), that are reported as stored without asking the server (see the Bloom filter false positives
+        above).
+
+        """
+        hashes = set(hashes)
+        found = set()
+        if skip_known and self.known is not None:
+            found = {hash for hash in hashes if hash in self.known}
+        unknown = list(hashes - found)
+        if not unknown:
+            return found
+
+        if concurrency <= 1 or len(unknown) == 1:
+            found.update(hash for hash in unknown if self.has(hash))
+            return found
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(
+            max_workers=min(concurrency, len(unknown)),
+            thread_name_prefix="blobstash-has-many",
+        ) as executor:
+            for hash, exists in zip(unknown, executor.map(self.has, unknown)):
+                if exists:
+                    found.add(hash)
+        return found
 
     def get(self, hash):
+        data, cached = self._fetch(hash)
+        if not cached:
+            if self.verifier is not None:
+                self.verifier.verify(hash, data)
+                self._cache_verified(hash, data)
+            elif self.cache is not None and blob_hash(data) == hash:
+                self.cache.put(hash, data)
+        return Blob(hash, data)
+
+    def _fetch(self, hash):
+        """Returns the blob data, and whether it comes from the cache (i.e. it's already verified)."""
+        if self.cache is not None:
+            data = self.cache.get(hash)
+            if data is not None:
+                return data, True
+
         resp = self._client.request(
             "GET", "/api/blobstore/blob/{}".format(hash), raw=True
         )
         try:
             resp.raise_for_status()
-            return Blob(hash, resp.content)
         except HTTPError as error:
             if error.response.status_code == 404:
                 raise BlobNotFoundError
             raise
 
+        return resp.content, False
+
+    def _cache_verified(self, hash, data):
+        if self.cache is not None:
+            self.cache.put(hash, data)
+
+    def get_into(self, hash, dst, chunk_size=STREAM_CHUNK_SIZE):
+        """Download a blob into `dst` without loading it in memory, and returns its size.
+
+        `dst` is either a writable binary file, or a preallocated writable buffer (e.g. a `bytearray`, a `memoryview`
+        or an `mmap`) filled from the beginning (`ValueError` is raised if it's too small). The response is read with
+        `readinto`, directly into the buffer (or into a single reused `chunk_size` buffer for a file), unless it has a
+        `Content-Encoding` (it's then decoded by chunks). The content is hashed on the fly, and `BlobHashMismatchError`
+        is raised if it doesn't match `hash` (once `dst` is written). The hashing is recorded in the `verifier` counters
+        (if any).
+
+        """
+        hasher = blake2b(digest_size=32)
+        is_file = hasattr(dst, "write")
+        view = None if is_file else memoryview(dst).cast("B")
+        pos = 0
+        hash_seconds = 0.0
+
+        def update(chunk):
+            nonlocal hash_seconds
+            start = time.perf_counter()
+            hasher.update(chunk)
+            hash_seconds += time.perf_counter() - start
+
+        def too_small():
+            return ValueError(
+                "buffer too small for blob {} ({} bytes)".format(hash, len(view))
+            )
+
+        def write(chunk):
+            nonlocal pos
+            update(chunk)
+            if is_file:
+                dst.write(chunk)
+            else:
+                end = pos + len(chunk)
+                if end > len(view):
+                    raise too_small()
+                view[pos:end] = chunk
+            pos += len(chunk)
+
+        data = self.cache.get(hash) if self.cache is not None else None
+        if data is not None:
+            write(memoryview(data).cast("B"))
+        else:
+            with self._client.request(
+                "GET", "/api/blobstore/blob/{}".format(hash), raw=True, stream=True
+            ) as resp:
+                if resp.status_code == 404:
+                    raise BlobNotFoundError
+                resp.raise_for_status()
+                if resp.headers.get("Content-Encoding"):
+                    for chunk in resp.iter_content(chunk_size):
+                        write(chunk)
+                else:
+                    buf = memoryview(bytearray(chunk_size)) if is_file else None
+                    while 1:
+                        if is_file:
+                            target = buf
+                        else:
+                            end = min(pos + chunk_size, len(view))
+                            target = view[pos:end]
+                        read = resp.raw.readinto(target) if len(target) else 0
+                        if not read:
+                            if not is_file and pos == len(view) and resp.raw.read(1):
+                                raise too_small()
+                            break
+                        chunk = target[:read]
+                        update(chunk)
+                        if is_file:
+                            dst.write(chunk)
+                        pos += read
+
+        actual_hash = hasher.hexdigest()
+        if self.verifier is not None:
+            self.verifier.record(1, pos, hash_seconds, int(actual_hash != hash))
+        if actual_hash != hash:
+            raise BlobHashMismatchError(hash, actual_hash)
+        return pos
+
+    def get_chunked(self, hash, dst, concurrency=8):
+        """Download the object uploaded with `put_chunked` (`hash` is the manifest hash) into `dst` (a binary file),
+        and returns its size."""
+        from blobstash.base.chunker import Manifest
+
+        manifest = Manifest.decode(self.get(hash).data)
+        size = 0
+        for blob in self.get_many(
+            [chunk_hash for chunk_hash, _ in manifest.chunks], concurrency=concurrency
+        ):
+            dst.write(blob.data)
+            size += _nbytes(blob.data)
+        if size != manifest.size:
+            raise BlobStoreError(
+                "object {} size is {}, expected {}".format(hash, size, manifest.size)
+            )
+        return size
+
+    def get_many(self, hashes, concurrency=8, ordered=True, on_missing=None):
+        """Fetch the blobs using up to `concurrency` parallel requests, and yield them.
+
+        With `ordered`, a blob is yielded for each of the given hashes, in the same order (a duplicate hash is fetched
+        once, and yielded again), otherwise each blob is yielded once, as soon as it's fetched. At most
+        `2 * concurrency` blobs are fetched ahead of the consumer.
+
+        Missing blobs don't stop the iteration: `on_missing(hash)` is called for each of them, or without
+        `on_missing`, `MissingBlobsError` is raised once all the other blobs are yielded.
+
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        missing = []
+        executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="blobstash-get-many"
+        )
+        futures = {}
+        try:
+            if ordered:
+                blobs = self._get_many_ordered(
+                    executor, futures, list(hashes), 2 * concurrency
+                )
+            else:
+                blobs = self._get_many_unordered(
+                    executor, futures, hashes, 2 * concurrency
+                )
+            if self.verifier is not None:
+                blobs = self._verified(blobs, 2 * concurrency)
+            for hash, blob in blobs:
+                if blob is not None:
+                    yield blob
+                elif on_missing is not None:
+                    on_missing(hash)
+                else:
+                    missing.append(hash)
+        finally:
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        if missing:
+            raise MissingBlobsError(missing)
+
+    def _get_or_none(self, hash):
+        """Returns the blob, or `None` if it doesn't exist (with a verifier, the blob is verified by `_verified`)."""
+        try:
+            if self.verifier is None:
+                return self.get(hash)
+            data, cached = self._fetch(hash)
+        except BlobNotFoundError:
+            return None
+
+        blob = Blob(hash, data)
+        # Not cached means not verified yet
+        blob._verified = cached
+        return blob
+
+    def _verified(self, results, window):
+        """Verify the fetched blobs by batches of `window` blobs (or `verifier.batch_bytes * verifier.workers`
+        bytes), and yield the (hash, blob or `None`) once verified."""
+        pending = []
+        size = 0
+        max_size = self.verifier.batch_bytes * self.verifier.workers
+        for hash, blob in results:
+            pending.append((hash, blob))
+            if blob is not None:
+                size += blob.size or 0
+            if len(pending) >= window or size >= max_size:
+                yield from self._verify_pending(pending)
+                pending = []
+                size = 0
+
+        yield from self._verify_pending(pending)
+
+    def _verify_pending(self, pending):
+        unverified = {}
+        for _, blob in pending:
+            if blob is not None and not blob._verified:
+                unverified[blob.hash] = blob
+        self.verifier.verify_many(
+            (hash, blob.data) for hash, blob in unverified.items()
+        )
+        for blob in unverified.values():
+            blob._verified = True
+            self._cache_verified(blob.hash, blob.data)
+        return pending
+
+    def _get_many_ordered(self, executor, futures, hashes, window):
+        """Yield the (hash, blob or `None`) of the given hashes, in order."""
+        remaining = Counter(hashes)
+        unique = list(remaining)
+        submitted = 0
+        consumed = 0
+        for hash in hashes:
+            while submitted < len(unique) and (
+                submitted - consumed < window or hash not in futures
+            ):
+                next_hash = unique[submitted]
+                futures[next_hash] = executor.submit(self._get_or_none, next_hash)
+                submitted += 1
+
+            blob = futures[hash].result()
+            remaining[hash] -= 1
+            if not remaining[hash]:
+                del futures[hash]
+                consumed += 1
+            # Missing blobs are reported once
+            if blob is not None or not remaining[hash]:
+                yield hash, blob
+
+    def _get_many_unordered(self, executor, futures, hashes, window):
+        """Yield the (hash, blob or `None`) of the given hashes (without duplicates), as they're fetched."""
+        from concurrent.futures import FIRST_COMPLETED
+        from concurrent.futures import wait
+
+        seen = set()
+        hashes = iter(hashes)
+        exhausted = False
+        while 1:
+            while not exhausted and len(futures) < window:
+                hash = next(hashes, None)
+                if hash is None:
+                    exhausted = True
+                elif hash not in seen:
+                    seen.add(hash)
+                    futures[hash] = executor.submit(self._get_or_none, hash)
+            if not futures:
+                return
+
+            done, _ = wait(futures.values(), return_when=FIRST_COMPLETED)
+            for hash, future in list(futures.items()):
+                if future in done:
+                    del futures[hash]
+                    yield hash, future.result()
+
     def iter(self, cursor=None, limit=None, per_page=None, **kwargs):
         return BlobsIterator(
             self._client, cursor=cursor, limit=limit, per_page=per_page, **kwargs
         )
 
+    def inventory(self, **kwargs):
+        """Returns a `blobstash.base.inventory.BlobInventory` of all the stored blobs (`kwargs` are passed to
+        `iter`)."""
+        from blobstash.base.inventory import BlobInventory
+
+        return BlobInventory.from_refs(self.iter(compact=True, **kwargs))
+
     def __iter__(self):
         return BlobsIterator(self._client)
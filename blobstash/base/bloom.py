@@ -0,0 +1,129 @@
+"""Bloom filter of blob hashes, used to remember the blobs known to be stored (see `BlobStoreClient` `known`)."""
+import math
+import os
+import struct
+import tempfile
+import threading
+from hashlib import blake2b
+
+_MAGIC = b"BSBLOOM1"
+_HEADER = struct.Struct(">QQQd")
+
+
+class BloomFilter:
+    """Compact probabilistic set of strings (blob hashes).
+
+    There are no false negatives (a hash added is always reported as present), but a hash never added is reported as
+    present with a probability of about `error_rate` once `capacity` hashes are added (more after that). The filter
+    uses about `1.44 * log2(1 / error_rate)` bits per hash (~29 bits, i.e. ~3.6MB for a million hashes, for the default
+    one in a million error rate).
+
+    It can be saved to disk (`save`/`load`) and filters with the same parameters can be merged (`merge`), e.g. to share
+    it between workers.
+
+    """
+
+    def __init__(self, capacity=1000000, error_rate=1e-6):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("invalid capacity/error_rate")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(
+            8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        )
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _indexes(self, key):
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        indexes = self._indexes(key)
+        bits = self._bits
+        with self._lock:
+            added = False
+            for index in indexes:
+                mask = 1 << (index & 7)
+                if not bits[index >> 3] & mask:
+                    bits[index >> 3] |= mask
+                    added = True
+            if added:
+                self.count += 1
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(
+            bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(key)
+        )
+
+    def __len__(self):
+        """Returns the approximate number of hashes added."""
+        return self.count
+
+    def merge(self, other):
+        """Add all the hashes of `other` (a filter with the same `capacity` and `error_rate`)."""
+        if (self.size, self.hashes) != (other.size, other.hashes):
+            raise ValueError("cannot merge Bloom filters with different parameters")
+        merged = int.from_bytes(self._bits, "big") | int.from_bytes(other._bits, "big")
+        with self._lock:
+            self._bits[:] = merged.to_bytes(len(self._bits), "big")
+            self.count = max(self.count, other.count)
+
+    def save(self, path):
+        """Atomically write the filter to `path` (written to a temporary file in the same directory, then renamed)."""
+        path = os.fspath(path)
+        with self._lock:
+            data = bytes(self._bits)
+            count = self.count
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix=".blobstash-bloom-",
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_MAGIC)
+                f.write(
+                    _HEADER.pack(self.capacity, self.hashes, count, self.error_rate)
+                )
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(_MAGIC):
+            raise ValueError("{} is not a Bloom filter".format(path))
+        capacity, hashes, count, error_rate = _HEADER.unpack_from(data, len(_MAGIC))
+        bloom = cls(capacity, error_rate)
+        offset = len(_MAGIC) + _HEADER.size
+        bits = data[offset:]
+        if bloom.hashes != hashes or len(bits) != len(bloom._bits):
+            raise ValueError("{} is corrupted".format(path))
+        bloom._bits[:] = bits
+        bloom.count = count
+        return bloom
+
+    def __repr__(self):
+        return "blobstash.base.bloom.BloomFilter(capacity={!r}, error_rate={!r}, count={!r})".format(
+            self.capacity, self.error_rate, self.count
+        )
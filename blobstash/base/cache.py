@@ -0,0 +1,256 @@
+"""Read-through blob caches for `BlobStoreClient.get`: an in-memory LRU, and an on-disk content-addressed store."""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+def blob_hash(data):
+    """Returns the hash of the given blob data (blake2b, 256 bits, hex encoded)."""
+    h = blake2b(digest_size=32)
+    h.update(data)
+    return h.hexdigest()
+
+
+class MemoryCache:
+    """LRU cache of the blobs of at most `max_blob_size` bytes, holding at most `max_bytes` bytes."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_blob_size=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_blob_size = max_blob_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._blobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, hash):
+        with self._lock:
+            data = self._blobs.get(hash)
+            if data is None:
+                self.misses += 1
+                return None
+            self._blobs.move_to_end(hash)
+            self.hits += 1
+            return data
+
+    def put(self, hash, data):
+        if len(data) > self.max_blob_size:
+            return
+        data = bytes(data)
+        with self._lock:
+            if hash in self._blobs:
+                self._blobs.move_to_end(hash)
+                return
+            self._blobs[hash] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def __repr__(self):
+        return "blobstash.base.cache.MemoryCache(size={!r}, max_bytes={!r})".format(
+            self.size, self.max_bytes
+        )
+
+
+class DiskCache:
+    """Content-addressed blob store in the `path` directory (one file per blob), bounded to about `max_bytes` bytes.
+
+    Blobs are written to a temporary file then renamed, so a reader never sees a partial blob, and several processes
+    can share the same directory. Reading a blob updates its modification time, and once the (per process) estimated
+    size exceeds `max_bytes`, the least recently used blobs are removed until the cache is back to `evict_to` of its
+    size, with an exclusive lock on `path/lock` (when supported) so processes don't evict concurrently.
+
+    Hits are validated by hash (corrupted blobs are removed and reported as missing).
+
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024, evict_to=0.9):
+        self.path = os.fspath(path)
+        self.max_bytes = max_bytes
+        self.evict_to = evict_to
+        self.hits = 0
+        self.misses = 0
+        self.corrupted = 0
+        self._blobs_dir = os.path.join(self.path, "blobs")
+        self._tmp_dir = os.path.join(self.path, "tmp")
+        os.makedirs(self._blobs_dir, exist_ok=True)
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _blob_path(self, hash):
+        """Returns the path of the blob, or `None` if `hash` is not a (lowercase) hex hash (not cacheable)."""
+        if len(hash) < 4 or not _HEX_DIGITS.issuperset(hash):
+            return None
+        return os.path.join(self._blobs_dir, hash[:2], hash)
+
+    def get(self, hash):
+        path = self._blob_path(hash)
+        if path is None:
+            self.misses += 1
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        if blob_hash(data) != hash:
+            self.corrupted += 1
+            self.misses += 1
+            _unlink(path)
+            return None
+
+        # Used for the LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, hash, data):
+        path = self._blob_path(hash)
+        if path is None or os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir, prefix=hash[:8])
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _unlink(tmp_path)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self.disk_usage()
+            else:
+                self._size += len(data)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def disk_usage(self):
+        """Returns the total size of the cached blobs."""
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        """Returns the (mtime, path, size) of the cached blobs."""
+        entries = []
+        for prefix in os.scandir(self._blobs_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used blobs until the cache size is below `evict_to * max_bytes`."""
+        with self._lock, _FileLock(os.path.join(self.path, "lock")):
+            entries = self._entries()
+            size = sum(entry_size for _, _, entry_size in entries)
+            target = self.max_bytes * self.evict_to
+            entries.sort()
+            for _, path, entry_size in entries:
+                if size <= target:
+                    break
+                _unlink(path)
+                size -= entry_size
+            self._size = size
+
+            # Cleanup the temporary files left by crashed writers
+            expired = time.time() - 3600
+            for entry in os.scandir(self._tmp_dir):
+                try:
+                    if entry.stat().st_mtime < expired:
+                        _unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def __repr__(self):
+        return "blobstash.base.cache.DiskCache(path={!r}, max_bytes={!r})".format(
+            self.path, self.max_bytes
+        )
+
+
+class BlobCache:
+    """Tiered blob cache: a `MemoryCache` (for the small blobs) in front of an optional `DiskCache`.
+
+    A blob found on disk is promoted in memory, and the blobs are added to both tiers.
+
+    """
+
+    def __init__(self, memory=None, disk=None):
+        self.memory = MemoryCache() if memory is None else memory
+        self.disk = disk
+
+    def get(self, hash):
+        data = self.memory.get(hash)
+        if data is not None:
+            return data
+        if self.disk is None:
+            return None
+
+        data = self.disk.get(hash)
+        if data is not None:
+            self.memory.put(hash, data)
+        return data
+
+    def put(self, hash, data):
+        self.memory.put(hash, data)
+        if self.disk is not None:
+            self.disk.put(hash, data)
+
+    def __repr__(self):
+        return "blobstash.base.cache.BlobCache(memory={!r}, disk={!r})".format(
+            self.memory, self.disk
+        )
+
+
+class _FileLock:
+    """Exclusive inter-process lock on the given file (a no-op if `fcntl` is not available)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,71 @@
+"""Durable checkpoints for resumable scans (see `BasePaginationIterator` `checkpoint` and `resume_from`)."""
+import json
+import os
+import tempfile
+
+
+class Checkpoint:
+    """Scan position (the cursor and the number of items returned so far) stored in a local JSON file.
+
+    The file is replaced atomically (written to a temporary file in the same directory, fsync'ed, then renamed), a
+    crash leaves either the previous or the new checkpoint.
+
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+
+    def load(self):
+        """Returns the saved state, or `None` if there's no checkpoint yet."""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, **state):
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(
+            dir=dirname, prefix=".blobstash-checkpoint-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        # Persist the rename too (not supported on every platform)
+        try:
+            dir_fd = os.open(dirname, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+    def clear(self):
+        """Remove the checkpoint (the next scan will start from the beginning)."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self):
+        return "blobstash.base.checkpoint.Checkpoint(path={!r})".format(self.path)
+
+
+def as_checkpoint(checkpoint):
+    """Returns a `Checkpoint` for the given path (or an existing `Checkpoint`, or `None`)."""
+    if checkpoint is None or isinstance(checkpoint, Checkpoint):
+        return checkpoint
+    return Checkpoint(checkpoint)
@@ -0,0 +1,222 @@
+"""Content-defined chunking (FastCDC) of large objects into blobs, reassembled with a manifest blob.
+
+Cut points depend on the content only (a rolling hash over the last `WINDOW` bytes), so an edit of a large object only
+changes the chunks around it, the other chunks (i.e. blobs) are shared with the previous version.
+
+"""
+import math
+import struct
+from hashlib import blake2b
+
+from blobstash.base.blobstore import Blob
+
+# Number of bytes covered by the rolling hash
+WINDOW = 24
+
+# Random byte for each byte value (the "gear" table), changing it would change all the cut points
+_GEAR = b"".join(
+    blake2b(b"blobstash.chunker.gear", digest_size=64, salt=bytes([i] * 16)).digest()
+    for i in range(4)
+)
+
+# Size of the blocks hashed at once
+_BLOCK_SIZE = 64 * 1024
+
+_UINT32 = struct.Struct("<I")
+
+
+def _hash_block(data):
+    """Returns the rolling hash of each position of `data`, as a little-endian `uint32` array (in a `bytes`), and its
+    third byte column (`bytes`).
+
+    The hash at position `i` is `sum(gear[data[i - j]] << j for j in range(WINDOW))` (always < 2**32), computed for
+    all the positions at once: each byte is stored in a 32 bits lane of a big integer, and the window sum is built
+    with a few shift and add of the whole integer (lanes never overflow in each other).
+
+    """
+    n = len(data)
+    lanes = bytearray(4 * n)
+    lanes[0::4] = data.translate(_GEAR)
+    x = int.from_bytes(lanes, "little")
+    # sum of the lanes shifted by j lanes and j bits, for j in range(WINDOW) (WINDOW = 24 = 16 + 8)
+    s2 = x + (x << 33)
+    s4 = s2 + (s2 << 66)
+    s8 = s4 + (s4 << 132)
+    s16 = s8 + (s8 << 264)
+    y = (s16 + (s8 << 528)).to_bytes(4 * n + 4 * WINDOW + 4, "little")
+    return y, y[2::4]
+
+
+class FastCDC:
+    """FastCDC chunker, splits a stream in chunks between `min_size` and `max_size` bytes, of about `avg_size` bytes.
+
+    It uses normalized chunking (a stricter cut condition before `avg_size`, and a looser one after), and skips the
+    first `min_size` bytes of each chunk. Instead of a per-byte Python loop, the rolling hash is computed for blocks of
+    64KB at once (see `_hash_block`), and the cut point candidates are found with `bytes.find` (only one position in
+    256 is then checked in Python).
+
+    `avg_size` is rounded to a power of two, between 1KB and 4MB.
+
+    """
+
+    def __init__(self, min_size=16 * 1024, avg_size=64 * 1024, max_size=256 * 1024):
+        if not 0 < min_size <= avg_size <= max_size:
+            raise ValueError("expected 0 < min_size <= avg_size <= max_size")
+        if max_size >= 1 << 32:
+            # The chunk sizes are stored as `uint32` in the manifest
+            raise ValueError("max_size must be below 4GB")
+        bits = round(math.log2(avg_size))
+        if not 10 <= bits <= 22:
+            raise ValueError("avg_size must be between 1KB and 4MB")
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        # The masks select the top bits of the 24 lower bits of the hash, both include the third byte (bits 16-23)
+        self._mask_s = ((1 << (bits + 2)) - 1) << (22 - bits)
+        self._mask_l = ((1 << (bits - 2)) - 1) << (26 - bits)
+
+    def _find_cut(self, buf, blocks, start):
+        """Returns the end of the chunk starting at `start` (`buf` contains at least `max_size` bytes after `start`,
+        or the end of the stream)."""
+        end = min(start + self.max_size, len(buf))
+        # Cut after position `i` means a chunk of `i + 1 - start` bytes
+        i = start + self.min_size - 1
+        normal = start + self.avg_size - 1
+        mask_s = self._mask_s
+        mask_l = self._mask_l
+        unpack_from = _UINT32.unpack_from
+        while i < end - 1:
+            block = i // _BLOCK_SIZE
+            hashed = blocks.get(block)
+            if hashed is None:
+                block_start = block * _BLOCK_SIZE
+                context = min(block_start, WINDOW - 1)
+                data_start = block_start - context
+                data_end = block_start + _BLOCK_SIZE
+                data = bytes(buf[data_start:data_end])
+                y, column = _hash_block(data)
+                hashed = blocks[block] = (y, column, block_start - context)
+            y, column, offset = hashed
+            block_end = min(end - 1, (block + 1) * _BLOCK_SIZE)
+            j = column.find(0, i - offset, block_end - offset)
+            while j != -1:
+                (fp,) = unpack_from(y, 4 * j)
+                if not fp & (mask_s if j + offset < normal else mask_l):
+                    return j + offset + 1
+                j = column.find(0, j + 1, block_end - offset)
+            i = block_end
+        return end
+
+    def split(self, src, read_size=None):
+        """Yield the chunks (`memoryview`) of `src`, a binary file or a bytes-like object.
+
+        The file is read `read_size` bytes at a time (4 * `max_size` or 1MB by default, and at least `max_size` so the
+        cut points don't depend on it), the chunks are views of the read buffer (they stay valid after the next chunk
+        is read).
+
+        """
+        read_size = max(
+            read_size or max(4 * self.max_size, 1024 * 1024), self.max_size + WINDOW
+        )
+        if hasattr(src, "read"):
+            read = src.read
+            buf = b""
+            eof = False
+        else:
+            read = None
+            buf = memoryview(src).cast("B")
+            eof = True
+
+        pos = 0
+        blocks = {}
+        while 1:
+            if not eof and len(buf) - pos < self.max_size:
+                # Keep the bytes needed by the rolling hash before the chunk start
+                keep = min(pos, WINDOW - 1)
+                kept = pos - keep
+                parts = [bytes(buf[kept:])]
+                size = len(parts[0])
+                while size < read_size:
+                    data = read(read_size - size)
+                    if not data:
+                        eof = True
+                        break
+                    parts.append(data)
+                    size += len(data)
+                buf = memoryview(b"".join(parts))
+                pos = keep
+                blocks = {}
+
+            if pos == len(buf):
+                return
+            end = self._find_cut(buf, blocks, pos)
+            yield buf[pos:end]
+            pos = end
+
+    def __repr__(self):
+        return "blobstash.base.chunker.FastCDC(min_size={!r}, avg_size={!r}, max_size={!r})".format(
+            self.min_size, self.avg_size, self.max_size
+        )
+
+
+class Manifest:
+    """List of the chunks (hash and size) of an object, stored as a blob.
+
+    The encoding is compact: a header (magic, total size and chunks count), then 36 bytes per chunk (the 32 bytes
+    binary hash and the size as a `uint32`).
+
+    """
+
+    MAGIC = b"blobstash.cdc.v1\n"
+    _HEADER = struct.Struct(">QI")
+    _CHUNK = struct.Struct(">32sI")
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    @property
+    def size(self):
+        return sum(size for _, size in self.chunks)
+
+    def encode(self):
+        parts = [self.MAGIC, self._HEADER.pack(self.size, len(self.chunks))]
+        for hash, size in self.chunks:
+            parts.append(self._CHUNK.pack(bytes.fromhex(hash), size))
+        return b"".join(parts)
+
+    @classmethod
+    def is_manifest(cls, data):
+        magic_size = len(cls.MAGIC)
+        return bytes(data[:magic_size]) == cls.MAGIC
+
+    @classmethod
+    def decode(cls, data):
+        if not cls.is_manifest(data):
+            raise ValueError("not a chunks manifest")
+        offset = len(cls.MAGIC)
+        size, count = cls._HEADER.unpack_from(data, offset)
+        offset += cls._HEADER.size
+        chunks = []
+        for i in range(count):
+            digest, chunk_size = cls._CHUNK.unpack_from(data, offset)
+            chunks.append((digest.hex(), chunk_size))
+            offset += cls._CHUNK.size
+        manifest = cls(chunks)
+        if manifest.size != size:
+            raise ValueError("corrupted chunks manifest")
+        return manifest
+
+    def to_blob(self):
+        return Blob.from_data(self.encode())
+
+    def __repr__(self):
+        return "blobstash.base.chunker.Manifest(chunks={!r}, size={!r})".format(
+            len(self.chunks), self.size
+        )
+
+
+def chunk_blobs(src, chunker=None):
+    """Yield the chunks of `src` (see `FastCDC.split`) as blobs."""
+    chunker = chunker or FastCDC()
+    for chunk in chunker.split(src):
+        yield Blob.from_data(chunk)
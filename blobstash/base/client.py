@@ -1,38 +1,368 @@
 """BlobStash client."""
-import json
 import os
+import threading
+import time
+from typing import Dict
 from urllib.parse import urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.exceptions import Timeout
+
+from blobstash.base.codec import get_codec
+from blobstash.base.deadline import as_deadline
+from blobstash.base.error import DeadlineExceededError
+from blobstash.base.limiter import READ_VERBS
+from blobstash.base.limiter import Limiter
+from blobstash.base.limiter import request_size
+from blobstash.base.routing import UNHEALTHY_STATUS_CODES
+from blobstash.base.routing import Endpoint
+from blobstash.base.routing import EndpointPool
+from blobstash.base.tracing import span
+from blobstash.base.unixsocket import UNIX_ROOT_URL
+from blobstash.base.unixsocket import UnixAdapter
+from blobstash.base.unixsocket import socket_path
 
 DEFAULT_BASE_URL = "http://localhost:8050"
 
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+# Default (connect, read) timeout in seconds, the read timeout is the maximum time between two bytes received (not the
+# total time of the response), so a stalled server doesn't hang an upload/download/scan forever
+DEFAULT_TIMEOUT = (10.0, 60.0)
+
+# Keep-alive sessions shared by every `Client` (and thus every sub-client) talking to the same BlobStash instance
+_SESSIONS: Dict[str, requests.Session] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(
+    base_url,
+    pool_connections=DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize=DEFAULT_POOL_MAXSIZE,
+    pool_block=False,
+):
+    """Return the pooled session for base_url, creating it if needed.
+
+    The pool settings are only used when the session is created, the first client for a given base_url configures it.
+
+    """
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(base_url)
+        if session is None:
+            session = requests.Session()
+            path = socket_path(base_url)
+            if path:
+                adapter = UnixAdapter(
+                    path, pool_maxsize=pool_maxsize, pool_block=pool_block
+                )
+            else:
+                adapter = HTTPAdapter(
+                    pool_connections=pool_connections,
+                    pool_maxsize=pool_maxsize,
+                    pool_block=pool_block,
+                )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSIONS[base_url] = session
+
+        return session
+
+
+# Limiters shared by every `Client` talking to the same BlobStash instance
+_LIMITERS: Dict[str, Limiter] = {}
+
+
+def set_limiter(base_url, limiter):
+    """Set the limiter used by all the clients for base_url (`None` to remove it)."""
+    if limiter is None:
+        _LIMITERS.pop(base_url, None)
+    else:
+        _LIMITERS[base_url] = limiter
+
+
+def _flight_key(base_url, path, kwargs):
+    params = kwargs.get("params") or {}
+    headers = kwargs.get("headers") or {}
+    # Clients with different credentials never share a response
+    return (
+        base_url,
+        kwargs.get("auth"),
+        path,
+        tuple(sorted(params.items())),
+        tuple(sorted(headers.items())),
+    )
+
+
+def close_sessions():
+    """Close all the pooled sessions (and their connections)."""
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
 
 class Client:
-    """Basic client for API-specific client to build upon."""
+    """Basic client for API-specific client to build upon.
+
+    Connections are kept alive in a pool shared by all the clients using the same base_url, `pool_connections` is the
+    number of hosts to cache pools for, `pool_maxsize` the maximum number of connections kept per host, and
+    `pool_block` makes requests wait for a free connection instead of opening a new one once the pool is full.
+
+    The base_url can also point to a Unix domain socket (e.g. `unix:///path/to/blobstash.sock`) when BlobStash runs on
+    the same host.
+
+    JSON bodies are encoded/decoded with `codec` (see `blobstash.base.codec`), orjson is used when it's installed
+    unless a custom `json_encoder` is given.
+
+    Pass a `blobstash.base.metrics.Metrics` instance as `metrics` to record per-endpoint latency/bytes/status codes.
+
+    Idempotent requests can be retried by passing a `blobstash.base.retry.RetryPolicy` as `retry`, and reads (`GET`) can
+    be hedged with a `blobstash.base.retry.HedgePolicy` as `hedge`.
+
+    A `blobstash.base.limiter.Limiter` passed as `limiter` is registered for the base_url (see `set_limiter`), and
+    applies to every client of this BlobStash instance.
+
+    With a `blobstash.base.singleflight.SingleFlight` as `single_flight`, concurrent identical `GET` requests (e.g.
+    the same blob, document or node fetched by several threads) share a single in-flight request and its response.
 
-    def __init__(self, base_url=None, api_key=None, json_encoder=json.JSONEncoder):
-        self.base_url = base_url or os.getenv("BLOBSTASH_BASE_URL", DEFAULT_BASE_URL)
+    `base_url` can also be a list of replicas (or a comma-separated string, e.g. in `BLOBSTASH_BASE_URL`): writes always
+    go to the first one (the primary), and reads are routed to the fastest healthy replica, failing over to the others
+    on connection errors (see `blobstash.base.routing.EndpointPool`, `routing` is passed as its keyword arguments).
+
+    `timeout` is the default timeout (in seconds, or a (connect, read) tuple, `DEFAULT_TIMEOUT` by default, `None` to
+    wait forever) for every request. A request can also be given a `deadline` (a `blobstash.base.deadline.Deadline` or
+    a number of seconds) shared with the other requests of a composite operation, `DeadlineExceededError` is raised
+    once it's exceeded (retries included).
+
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        api_key=None,
+        json_encoder=None,
+        codec=None,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        pool_block=False,
+        metrics=None,
+        retry=None,
+        hedge=None,
+        limiter=None,
+        single_flight=None,
+        routing=None,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        base_urls = base_url or os.getenv("BLOBSTASH_BASE_URL", DEFAULT_BASE_URL)
+        if isinstance(base_urls, str):
+            base_urls = [url.strip() for url in base_urls.split(",")]
+        self.base_urls = list(base_urls)
+        self.base_url = self.base_urls[0]
         self.api_key = api_key or os.getenv("BLOBSTASH_API_KEY")
         self.json_encoder = json_encoder
+        self.codec = codec or get_codec(json_encoder)
+        self.metrics = metrics
+        self.retry = retry
+        self.hedge = hedge
+        self.single_flight = single_flight
+        self.timeout = timeout
+        if limiter is not None:
+            set_limiter(self.base_url, limiter)
+        self._root_url = UNIX_ROOT_URL if socket_path(self.base_url) else self.base_url
+        self.session = get_session(
+            self.base_url,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        self.endpoints = None
+        if len(self.base_urls) > 1:
+            endpoints = [Endpoint(self.base_url, self.session)]
+            for url in self.base_urls[1:]:
+                session = get_session(
+                    url,
+                    pool_connections=pool_connections,
+                    pool_maxsize=pool_maxsize,
+                    pool_block=pool_block,
+                )
+                endpoints.append(Endpoint(url, session))
+            self.endpoints = EndpointPool(endpoints, **(routing or {}))
 
     def request(self, verb: str, path: str, **kwargs):
         """Helper for making authenticated request to BlobStash."""
-        raw = kwargs.pop("raw", False)
-        json_data = kwargs.pop("json", None)
-        if json_data:
-            kwargs["data"] = json.dumps(json_data, cls=self.json_encoder)
-            headers = kwargs.get("headers", {})
-            headers["Content-Type"] = "application/json"
-            kwargs["headers"] = headers
-
-        if self.api_key:
-            kwargs["auth"] = ("", self.api_key)
-
-        r = requests.request(verb, urljoin(self.base_url, path), **kwargs)
-        if raw:
+        with span(
+            "blobstash.request", {"http.method": verb, "url.path": path}
+        ) as request_span:
+            raw = kwargs.pop("raw", False)
+            deadline = as_deadline(kwargs.pop("deadline", None))
+            kwargs.setdefault("timeout", self.timeout)
+            json_data = kwargs.pop("json", None)
+            if json_data:
+                with span("blobstash.json.encode"):
+                    kwargs["data"] = self.codec.dumps(json_data)
+                headers = kwargs.get("headers", {})
+                headers["Content-Type"] = "application/json"
+                kwargs["headers"] = headers
+
+            if self.api_key:
+                kwargs["auth"] = ("", self.api_key)
+
+            with span("blobstash.http"):
+                if (
+                    self.single_flight is not None
+                    and verb == "GET"
+                    and not kwargs.get("stream")
+                ):
+                    r = self.single_flight.do(
+                        _flight_key(self.base_url, path, kwargs),
+                        lambda: self._perform(verb, path, deadline, **kwargs),
+                    )
+                else:
+                    r = self._perform(verb, path, deadline, **kwargs)
+            request_span.set_attribute("http.status_code", r.status_code)
+            if raw:
+                return r
+
+            r.raise_for_status()
+            if r.status_code != 204:
+                with span("blobstash.json.decode"):
+                    return self.codec.loads(r.content)
+
+    def _perform(self, verb, path, deadline=None, **kwargs):
+        try:
+            if self.retry is None:
+                if deadline is not None:
+                    kwargs["timeout"] = deadline.timeout(kwargs["timeout"])
+                return self._attempt(verb, path, **kwargs)
+
+            return self._retried_request(verb, path, deadline, **kwargs)
+        except Timeout as error:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceededError(
+                    "deadline of {}s exceeded".format(deadline.seconds)
+                ) from error
+            raise
+
+    def _retried_request(self, verb, path, deadline, **kwargs):
+        timeout = kwargs["timeout"]
+        attempt = 1
+        while 1:
+            if deadline is not None:
+                kwargs["timeout"] = deadline.timeout(timeout)
+            try:
+                r = self._attempt(verb, path, **kwargs)
+            except (ConnectionError, Timeout):
+                if not self.retry.should_retry(verb, attempt):
+                    raise
+                delay = self.retry.delay(attempt)
+            else:
+                if r.status_code not in self.retry.status_codes:
+                    return r
+                if not self.retry.should_retry(verb, attempt):
+                    return r
+                r.close()
+                delay = self.retry.delay(attempt, r.headers.get("Retry-After"))
+
+            if deadline is not None:
+                # Don't sleep past the deadline, the next attempt will fail fast
+                delay = min(delay, max(0, deadline.remaining()))
+            time.sleep(delay)
+            attempt += 1
+
+    def _attempt(self, verb, path, **kwargs):
+        if self.hedge is not None and verb == "GET" and not kwargs.get("stream"):
+            start = time.perf_counter()
+            r = self.hedge.run(lambda: self._send(verb, path, **kwargs))
+            self.hedge.observe(time.perf_counter() - start)
             return r
 
-        r.raise_for_status()
-        if r.status_code != 204:
-            return r.json()
+        return self._send(verb, path, **kwargs)
+
+    def _send(self, verb, path, **kwargs):
+        limiter = _LIMITERS.get(self.base_url)
+        if limiter is None:
+            return self._http_request(verb, path, **kwargs)
+
+        with limiter.limit(verb, request_size(kwargs)):
+            r = self._http_request(verb, path, **kwargs)
+
+        if verb in READ_VERBS:
+            if kwargs.get("stream"):
+                limiter.reads.charge(int(r.headers.get("Content-Length") or 0))
+            else:
+                limiter.reads.charge(len(r.content))
+        return r
+
+    def _http_request(self, verb, path, **kwargs):
+        if self.endpoints is not None:
+            return self._routed_request(verb, path, **kwargs)
+
+        if self.metrics is None:
+            return self.session.request(verb, urljoin(self._root_url, path), **kwargs)
+
+        return self._observed_request(
+            self.session, self._root_url, verb, path, **kwargs
+        )
+
+    def _routed_request(self, verb, path, **kwargs):
+        if verb not in READ_VERBS:
+            return self._endpoint_request(
+                self.endpoints.pick_write(), verb, path, **kwargs
+            )
+
+        tried = []
+        while 1:
+            endpoint = self.endpoints.pick_read(exclude=tried)
+            try:
+                return self._endpoint_request(endpoint, verb, path, **kwargs)
+            except (ConnectionError, Timeout):
+                tried.append(endpoint)
+                if len(tried) == len(self.endpoints):
+                    raise
+
+    def _endpoint_request(self, endpoint, verb, path, **kwargs):
+        self.endpoints.start(endpoint)
+        start = time.perf_counter()
+        try:
+            if self.metrics is None:
+                r = endpoint.session.request(
+                    verb, urljoin(endpoint.root_url, path), **kwargs
+                )
+            else:
+                r = self._observed_request(
+                    endpoint.session, endpoint.root_url, verb, path, **kwargs
+                )
+        except Exception:
+            self.endpoints.done(endpoint, time.perf_counter() - start, False)
+            raise
+
+        ok = r.status_code not in UNHEALTHY_STATUS_CODES
+        self.endpoints.done(endpoint, time.perf_counter() - start, ok)
+        return r
+
+    def _observed_request(self, session, root_url, verb, path, **kwargs):
+        from blobstash.base.metrics import body_size
+
+        start = time.perf_counter()
+        try:
+            r = session.request(verb, urljoin(root_url, path), **kwargs)
+        except Exception:
+            self.metrics.observe(verb, path, "error", time.perf_counter() - start)
+            raise
+
+        if kwargs.get("stream"):
+            response_bytes = int(r.headers.get("Content-Length") or 0)
+        else:
+            response_bytes = len(r.content)
+        self.metrics.observe(
+            verb,
+            path,
+            r.status_code,
+            time.perf_counter() - start,
+            request_bytes=body_size(r.request.body),
+            response_bytes=response_bytes,
+        )
+        return r
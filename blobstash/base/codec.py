@@ -0,0 +1,100 @@
+"""JSON codecs for requests/responses body, using orjson when it's installed (`pip install blobstash[orjson]`)."""
+import json
+from typing import Any
+from typing import Callable
+from typing import Dict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+# Custom types encoders shared by all the codecs (e.g. the docstore `Attachment` pointers)
+_TYPE_ENCODERS: Dict[type, Callable[[Any], Any]] = {}
+
+
+def register_type(type_, encode):
+    """Register a function returning a JSON serializable representation of type_ instances."""
+    _TYPE_ENCODERS[type_] = encode
+
+
+def _find_encoder(type_):
+    """Returns the encoder registered for type_ or its closest base class, or `None`."""
+    for base in type_.__mro__:
+        encode = _TYPE_ENCODERS.get(base)
+        if encode is not None:
+            return encode
+    return None
+
+
+def _encode_type(obj):
+    encode = _find_encoder(type(obj))
+    if encode is None:
+        raise TypeError(
+            "Object of type {} is not JSON serializable".format(type(obj).__name__)
+        )
+    return encode(obj)
+
+
+class StdlibCodec:
+    """Codec using the `json` module, `encoder` can be a custom `json.JSONEncoder` subclass."""
+
+    name = "json"
+
+    def __init__(self, encoder=json.JSONEncoder):
+        class _Encoder(encoder):  # type: ignore
+            def default(self, obj):
+                encode = _find_encoder(type(obj))
+                if encode is not None:
+                    return encode(obj)
+                return super().default(obj)
+
+        self._encoder = _Encoder(separators=(",", ":"))
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """Codec using orjson, falls back to the `json` module for the few payloads orjson rejects (e.g. big ints)."""
+
+    name = "orjson"
+
+    def __init__(self):
+        self._fallback = StdlibCodec()
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(
+                obj, default=_encode_type, option=orjson.OPT_NON_STR_KEYS
+            )
+        except TypeError:
+            return self._fallback.dumps(obj)
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return self._fallback.loads(data)
+
+
+_DEFAULT_CODEC = None
+
+
+def default_codec():
+    """Returns the fastest available codec."""
+    global _DEFAULT_CODEC
+    if _DEFAULT_CODEC is None:
+        _DEFAULT_CODEC = OrjsonCodec() if orjson is not None else StdlibCodec()
+    return _DEFAULT_CODEC
+
+
+def get_codec(json_encoder=None):
+    """Returns the codec to use for the given `json.JSONEncoder` subclass (the default codec if `None`)."""
+    if json_encoder is None or json_encoder is json.JSONEncoder:
+        return default_codec()
+
+    return StdlibCodec(json_encoder)
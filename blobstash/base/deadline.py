@@ -0,0 +1,54 @@
+"""Deadline budgets shared by the sub-requests of a composite operation (uploads, downloads, paginated scans)."""
+import time
+
+from blobstash.base.error import DeadlineExceededError
+
+
+class Deadline:
+    """Time budget of `seconds` for an operation, starting now.
+
+    Every sub-request gets the smallest of the remaining budget and its own timeout, and once the budget runs out
+    `DeadlineExceededError` is raised before sending anything else.
+
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Returns the remaining number of seconds (can be negative)."""
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        """Raise `DeadlineExceededError` if the budget is spent."""
+        if self.expired():
+            raise DeadlineExceededError("deadline of {}s exceeded".format(self.seconds))
+
+    def timeout(self, timeout=None):
+        """Returns the `requests` timeout for the next sub-request, `timeout` can be a float or a (connect, read)
+        tuple."""
+        self.check()
+        remaining = self.remaining()
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
+
+    def __repr__(self):
+        return (
+            "blobstash.base.deadline.Deadline(seconds={!r}, remaining={:.3f})".format(
+                self.seconds, self.remaining()
+            )
+        )
+
+
+def as_deadline(deadline):
+    """Returns a `Deadline` for the given number of seconds (or an existing `Deadline`, or `None`)."""
+    if deadline is None or isinstance(deadline, Deadline):
+        return deadline
+    return Deadline(deadline)
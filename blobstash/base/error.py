@@ -3,3 +3,7 @@
 
 class BlobStashError(Exception):
     """Base error for all the client errors."""
+
+
+class DeadlineExceededError(BlobStashError):
+    """Error raised when the deadline of an operation is exceeded."""
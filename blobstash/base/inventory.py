@@ -0,0 +1,165 @@
+"""Compact in-memory inventory of blobs (binary hashes and sizes stored in arrays), with fast set operations."""
+import math
+from array import array
+
+from blobstash.base.blobstore import BlobRef
+
+DIGEST_SIZE = 32
+
+
+class BlobInventory:
+    """Sorted set of blobs stored as a single buffer of 32 bytes binary hashes and an `array` of sizes (40 bytes per
+    blob, instead of a few hundreds for a `Blob` object).
+
+    Membership is a binary search, and the set operations (`difference`/`-`, `intersection`/`&`, `union`/`|`) merge
+    the sorted arrays (or binary search the biggest one when the other is much smaller), without creating an object
+    per blob.
+
+    Building an inventory (`from_refs`) sorts the hashes, it temporarily needs about 200 bytes per blob.
+
+    """
+
+    def __init__(self, digests=b"", sizes=None):
+        # `digests` must be sorted and without duplicates
+        self._digests = bytes(digests)
+        self._sizes = sizes if sizes is not None else array("Q")
+        if len(self._digests) != DIGEST_SIZE * len(self._sizes):
+            raise ValueError("digests and sizes length mismatch")
+
+    @classmethod
+    def from_refs(cls, refs):
+        """Build an inventory from an iterable of objects with a hex `hash` and a `size` (e.g. `BlobRef` or `Blob`)."""
+        sizes = {}
+        for ref in refs:
+            digest = bytes.fromhex(ref.hash)
+            if len(digest) != DIGEST_SIZE:
+                raise ValueError("invalid blob hash {!r}".format(ref.hash))
+            sizes[digest] = ref.size or 0
+
+        digests = sorted(sizes)
+        return cls(b"".join(digests), array("Q", [sizes[digest] for digest in digests]))
+
+    def _digest(self, index):
+        start = index * DIGEST_SIZE
+        end = start + DIGEST_SIZE
+        return self._digests[start:end]
+
+    def _find(self, digest):
+        """Returns the index of the given binary hash, or -1."""
+        lo = 0
+        hi = len(self._sizes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._digest(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._sizes) and self._digest(lo) == digest:
+            return lo
+        return -1
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __contains__(self, hash):
+        """`hash` can be the hex encoded or binary hash."""
+        if isinstance(hash, str):
+            hash = bytes.fromhex(hash)
+        return self._find(hash) != -1
+
+    def size_of(self, hash):
+        """Returns the size of the given blob, or `None` if it's not in the inventory."""
+        if isinstance(hash, str):
+            hash = bytes.fromhex(hash)
+        index = self._find(hash)
+        if index == -1:
+            return None
+        return self._sizes[index]
+
+    @property
+    def total_size(self):
+        return sum(self._sizes)
+
+    def __iter__(self):
+        for index, size in enumerate(self._sizes):
+            yield BlobRef(self._digest(index).hex(), size)
+
+    def hashes(self):
+        """Yield the hex encoded hashes."""
+        for index in range(len(self._sizes)):
+            yield self._digest(index).hex()
+
+    def _select(self, other, keep):
+        """Returns the inventory of the blobs of `self` that are (`keep` is `True`) or are not in `other`."""
+        digests = bytearray()
+        sizes = array("Q")
+        n, m = len(self), len(other)
+        if n * math.log2(m + 1) < n + m:
+            # Much smaller than `other`, binary search it
+            for index in range(n):
+                digest = self._digest(index)
+                if (other._find(digest) != -1) == keep:
+                    digests += digest
+                    sizes.append(self._sizes[index])
+            return BlobInventory(digests, sizes)
+
+        i = j = 0
+        while i < n:
+            digest = self._digest(i)
+            while j < m and other._digest(j) < digest:
+                j += 1
+            found = j < m and other._digest(j) == digest
+            if found == keep:
+                digests += digest
+                sizes.append(self._sizes[i])
+            i += 1
+        return BlobInventory(digests, sizes)
+
+    def difference(self, other):
+        return self._select(other, False)
+
+    def intersection(self, other):
+        if len(other) < len(self):
+            return other._select(self, True)
+        return self._select(other, True)
+
+    def union(self, other):
+        digests = bytearray()
+        sizes = array("Q")
+        n, m = len(self), len(other)
+        i = j = 0
+        while i < n and j < m:
+            a = self._digest(i)
+            b = other._digest(j)
+            if a <= b:
+                digests += a
+                sizes.append(self._sizes[i])
+                i += 1
+                if a == b:
+                    j += 1
+            else:
+                digests += b
+                sizes.append(other._sizes[j])
+                j += 1
+
+        start, end = i * DIGEST_SIZE, n * DIGEST_SIZE
+        digests += self._digests[start:end]
+        sizes.extend(self._sizes[i:])
+        start, end = j * DIGEST_SIZE, m * DIGEST_SIZE
+        digests += other._digests[start:end]
+        sizes.extend(other._sizes[j:])
+        return BlobInventory(digests, sizes)
+
+    __sub__ = difference
+    __and__ = intersection
+    __or__ = union
+
+    def __eq__(self, other):
+        if not isinstance(other, BlobInventory):
+            return NotImplemented
+        return self._digests == other._digests
+
+    def __repr__(self):
+        return "blobstash.base.inventory.BlobInventory(blobs={!r}, total_size={!r})".format(
+            len(self), self.total_size
+        )
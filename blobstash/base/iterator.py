@@ -1,10 +1,115 @@
 """Base pagination iterator for traversing API respones."""
+import json
+import queue
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from typing import Tuple
+
+from blobstash.base.checkpoint import as_checkpoint
+from blobstash.base.deadline import as_deadline
+from blobstash.base.jsonstream import JSONStream
+from blobstash.base.tracing import span
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Page size used by the server when no `limit` is requested
+DEFAULT_PAGE_SIZE = 50
+
+
+class AdaptivePageSize:
+    """Page size (to be used as an iterator `per_page`) adjusted after each page from the observed response latency
+    and payload size.
+
+    The size targets `target_seconds` and `target_bytes` per page (whichever gives the smallest page), it changes by at
+    most a `max_growth` factor after each page, and stays between `min_size` and `max_size`. Small items end up in big
+    pages and big items in small pages.
+
+    """
+
+    def __init__(
+        self,
+        target_seconds=0.25,
+        target_bytes=4 * 1024 * 1024,
+        initial=100,
+        min_size=10,
+        max_size=1000,
+        max_growth=2.0,
+    ):
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_growth = max_growth
+        self.size = initial
+
+    def observe(self, items, seconds=None, size=None):
+        """Update the page size after a page of `items` items took `seconds` seconds, for a body of `size` bytes."""
+        if not items:
+            return
+
+        ideal = []
+        if seconds and self.target_seconds:
+            ideal.append(self.target_seconds * items / seconds)
+        if size and self.target_bytes:
+            ideal.append(self.target_bytes * items / size)
+        if not ideal:
+            return
+
+        target = min(ideal)
+        target = max(
+            self.size / self.max_growth, min(self.size * self.max_growth, target)
+        )
+        self.size = int(max(self.min_size, min(self.max_size, target)))
+
+    def __repr__(self):
+        return "blobstash.base.iterator.AdaptivePageSize(size={!r})".format(self.size)
 
 
 class BasePaginationIterator:
+    """Iterate over the items of a paginated API.
+
+    With `stream`, each page is decoded incrementally while it's read from the socket (see
+    `blobstash.base.jsonstream.JSONStream`), and the items are yielded as they arrive, instead of loading the whole
+    page in memory.
+
+    With `prefetch` (the number of pages to read ahead), the next pages are fetched (and parsed) by a background
+    thread while the current one is consumed, call `close` (or use it as a context manager) to stop it early.
+
+    `per_page` can be an `AdaptivePageSize` to adjust the page size to the items size, and when there's a `limit`, the
+    last page is sized to the remaining items.
+
+    With `checkpoint` (a path or a `blobstash.base.checkpoint.Checkpoint`), the cursor and the number of items returned
+    so far are durably saved each time a page is fully consumed, and `resume_from` restarts the scan from a saved
+    checkpoint (if it exists). The page being consumed at the time of the crash is returned again (at-least-once). The
+    checkpoint also records the path and params (e.g. the docstore query), `ValueError` is raised when resuming a
+    different scan.
+
+    """
+
+    # Top-level keys of the response needed by `parse_item` (e.g. the docstore "pointers"), when streaming, the items
+    # are buffered until these keys are decoded
+    item_requires: Tuple[str, ...] = ()
+
     def __init__(
-        self, client, path, params=None, limit=None, per_page=None, cursor=None
+        self,
+        client,
+        path,
+        params=None,
+        limit=None,
+        per_page=None,
+        cursor=None,
+        deadline=None,
+        stream=False,
+        prefetch=0,
+        checkpoint=None,
+        resume_from=None,
     ):
+        if stream and prefetch:
+            raise ValueError("stream and prefetch cannot be combined")
+
         self._client = client
         self.path = path
 
@@ -16,49 +121,344 @@ class BasePaginationIterator:
         self.per_page = per_page
 
         self.has_more = True
-        self.items = []
+        self.items = deque()
 
         self.limit = limit
         self._returned = 0
+        self._fetched = 0
+
+        # Time budget for the whole iteration (all the pages)
+        self.deadline = as_deadline(deadline)
+
+        self.stream = stream
+        self._page = None
+
+        self.prefetch = prefetch
+        self._pages = None
+        self._closed = threading.Event()
+
+        self.checkpoint = as_checkpoint(checkpoint)
+        if resume_from is not None:
+            self.resume(as_checkpoint(resume_from))
+
+    def resume(self, checkpoint):
+        """Restore the position saved in the given checkpoint (if any)."""
+        state = checkpoint.load()
+        if state is None:
+            return
+        if state["path"] != self.path:
+            raise ValueError(
+                "checkpoint {} is for {}, not {}".format(
+                    checkpoint.path, state["path"], self.path
+                )
+            )
+        if state.get("params", {}) != self._checkpoint_params():
+            raise ValueError(
+                "checkpoint {} is for params {!r}, not {!r}".format(
+                    checkpoint.path, state.get("params", {}), self.params
+                )
+            )
+        self.cursor = state["cursor"]
+        self._returned = self._fetched = state["returned"]
+        self.has_more = not state["done"]
+
+    def _checkpoint_params(self):
+        """Returns the request params (e.g. the docstore query) as stored in the checkpoint."""
+        return json.loads(json.dumps(self.params, sort_keys=True))
+
+    def save_checkpoint(self):
+        """Save the current position, must only be called at a page boundary (when the buffer is empty)."""
+        self.checkpoint.save(
+            path=self.path,
+            params=self._checkpoint_params(),
+            cursor=self.cursor,
+            returned=self._returned,
+            done=not self.has_more,
+        )
 
     def parse_resp(self, resp):
-        self.items = []
+        self.items = deque(self.parse_data(resp))
+        self._fetched += len(self.items)
+        self.parse_pagination(resp["pagination"])
 
-        try:
-            self.items = self.parse_data(resp)
-        except NotImplementedError:
-            self.items = resp["data"]
-
-        pagination = resp["pagination"]
-        self.has_more = pagination["has_more"]
-        self.cursor = pagination["cursor"]
-        if self.has_more and (not self.cursor or self.cursor == "0"):
-            self.has_more = False
+    def parse_pagination(self, pagination):
+        self.has_more, self.cursor = _next_page(pagination)
         self.count = pagination["count"]
 
-    def do_req(self):
+    def page_size(self):
+        """Returns the number of items to request for the next page."""
+        per_page = self.per_page
+        if isinstance(per_page, AdaptivePageSize):
+            per_page = per_page.size
+        # Don't fetch more than needed for the last page
+        if self.limit:
+            per_page = max(
+                1, min(per_page or DEFAULT_PAGE_SIZE, self.limit - self._fetched)
+            )
+        return per_page
+
+    def page_params(self, cursor):
         params = self.params.copy()
-        params.update(limit=self.per_page, cursor=self.cursor)
+        params.update(limit=self.page_size(), cursor=cursor)
+        return params
+
+    def do_req(self, cursor=None):
+        if cursor is None:
+            cursor = self.cursor
+        params = self.page_params(cursor)
+        if not isinstance(self.per_page, AdaptivePageSize):
+            return self._client.request(
+                "GET", self.path, params=params, deadline=self.deadline
+            )
 
-        return self._client.request("GET", self.path, params=params)
+        start = time.perf_counter()
+        r = self._client.request(
+            "GET", self.path, params=params, deadline=self.deadline, raw=True
+        )
+        r.raise_for_status()
+        resp = self._client.codec.loads(r.content)
+        self.per_page.observe(
+            len(resp["data"]), time.perf_counter() - start, len(r.content)
+        )
+        return resp
 
-    def parse_data(self, data):
+    def parse_data(self, resp):
         """Custom function can return a list of dict/object that will be yield during iteration."""
-        raise NotImplementedError
+        return [self.parse_item(item, resp) for item in resp["data"]]
+
+    def parse_item(self, item, resp):
+        """Custom function can return the dict/object that will be yield for the raw item.
+
+        `resp` contains the other top-level keys of the response (only the `item_requires` ones are guaranteed to be
+        there when streaming).
+
+        """
+        return item
+
+    def iter_stream_page(self):
+        """Fetch the next page and yield its items as they're decoded."""
+        r = self._client.request(
+            "GET",
+            self.path,
+            params=self.page_params(self.cursor),
+            deadline=self.deadline,
+            raw=True,
+            stream=True,
+        )
+        try:
+            r.raise_for_status()
+            size = 0
+
+            def chunks():
+                nonlocal size
+                for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                    size += len(chunk)
+                    yield chunk
+
+            page = JSONStream(chunks())
+            pending = []
+            for item in page:
+                self._fetched += 1
+                if not all(key in page.resp for key in self.item_requires):
+                    pending.append(item)
+                    continue
+
+                if pending:
+                    for pending_item in pending:
+                        yield self.parse_item(pending_item, page.resp)
+                    pending = []
+                yield self.parse_item(item, page.resp)
+
+            for item in pending:
+                yield self.parse_item(item, page.resp)
+            self.parse_pagination(page.resp["pagination"])
+            # The time spent reading the page also depends on the consumer, only its size is used
+            if isinstance(self.per_page, AdaptivePageSize):
+                self.per_page.observe(page.resp["pagination"]["count"], size=size)
+        finally:
+            r.close()
+
+    def _next_prefetched_page(self):
+        if self._closed.is_set():
+            raise StopIteration
+        if self._pages is None:
+            self._pages = queue.Queue(self.prefetch)
+            # The thread only holds a weak reference to the iterator, an abandoned iterator (e.g. `break` in a loop)
+            # is collected and stops it
+            weakref.finalize(self, self._closed.set)
+            threading.Thread(
+                target=_prefetch_pages,
+                args=(weakref.ref(self), self.cursor, self._pages, self._closed),
+                name="blobstash-prefetch",
+                daemon=True,
+            ).start()
+
+        page = self._pages.get()
+        if page is None:
+            self.has_more = False
+            return
+        items, pagination, error = page
+        if error is not None:
+            self.close()
+            raise error
+        self.items = items
+        self.parse_pagination(pagination)
+
+    def close(self):
+        """Release the connection used by the page being streamed, and stop the prefetching (if any)."""
+        if self._page is not None:
+            self._page.close()
+            self._page = None
+        self._closed.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def __iter__(self):
         return self
 
     def __next__(self):
         if self.limit and self._returned == self.limit:
+            self.close()
             raise StopIteration
+        if self._page is not None:
+            try:
+                item = next(self._page)
+            except StopIteration:
+                self._page = None
+                return next(self)
+            self._returned += 1
+            return item
         try:
-            item = self.items.pop(0)
+            item = self.items.popleft()
             self._returned += 1
             return item
         except IndexError:
+            if self.checkpoint is not None:
+                self.save_checkpoint()
             if not self.has_more:
                 raise StopIteration
-            resp = self.do_req()
-            self.parse_resp(resp)
+            if self.stream:
+                self._page = self.iter_stream_page()
+            else:
+                self._load_page()
             return next(self)
+
+    def _load_page(self):
+        """Fetch the next page in the items buffer."""
+        if self.stream:
+            self.items.extend(self.iter_stream_page())
+        elif self.prefetch:
+            self._next_prefetched_page()
+        else:
+            with span("blobstash.page", {"url.path": self.path}):
+                resp = self.do_req()
+                self.parse_resp(resp)
+
+    def iter_pages(self):
+        """Yield the remaining items a page (list) at a time, `cursor` is the cursor of the next page after each page.
+
+        The items already buffered (if `next` was called before) are returned first. When streaming, each page is
+        still decoded incrementally, but collected in a list.
+
+        """
+        if self._page is not None:
+            self.items.extend(self._page)
+            self._page = None
+
+        while 1:
+            remaining = None
+            if self.limit:
+                remaining = self.limit - self._returned
+                if remaining <= 0:
+                    self.close()
+                    return
+
+            if not self.items:
+                if self.checkpoint is not None:
+                    self.save_checkpoint()
+                if not self.has_more:
+                    return
+                self._load_page()
+                continue
+
+            if remaining is not None and remaining < len(self.items):
+                page = [self.items.popleft() for _ in range(remaining)]
+            else:
+                page = list(self.items)
+                self.items.clear()
+            self._returned += len(page)
+            yield page
+
+    def iter_batches(self, size):
+        """Yield the remaining items in lists of `size` items (the last one can be smaller), regardless of the pages
+        size."""
+        batch = []
+        for page in self.iter_pages():
+            start = 0
+            if batch:
+                start = size - len(batch)
+                batch.extend(page[:start])
+                if len(batch) < size:
+                    continue
+                yield batch
+
+            while len(page) - start >= size:
+                end = start + size
+                yield page[start:end]
+                start = end
+            batch = page[start:]
+
+        if batch:
+            yield batch
+
+
+def _prefetch_pages(ref, cursor, pages, closed):
+    """Fetch and parse the pages of the iterator (`ref` is a weak reference to it) in the background, the iterator
+    state (cursor...) is only updated when a page is consumed."""
+    try:
+        while not closed.is_set():
+            iterator = ref()
+            if iterator is None:
+                return
+            with span("blobstash.page", {"url.path": iterator.path}):
+                resp = iterator.do_req(cursor)
+                page = (deque(iterator.parse_data(resp)), resp["pagination"], None)
+            has_more, cursor = _next_page(resp["pagination"])
+            iterator._fetched += len(page[0])
+            done = not has_more or (
+                iterator.limit and iterator._fetched >= iterator.limit
+            )
+            # Don't keep the iterator alive while waiting for the consumer
+            iterator = None
+            if not _put_page(pages, closed, page) or done:
+                return
+    except Exception as error:
+        iterator = None
+        # Release the iterator referenced by the failed frames
+        traceback.clear_frames(error.__traceback__)
+        _put_page(pages, closed, (None, None, error))
+    finally:
+        _put_page(pages, closed, None)
+
+
+def _put_page(pages, closed, page):
+    while not closed.is_set():
+        try:
+            pages.put(page, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _next_page(pagination):
+    """Returns a (has_more, cursor) tuple for the given pagination data."""
+    has_more = pagination["has_more"]
+    cursor = pagination["cursor"]
+    if has_more and (not cursor or cursor == "0"):
+        has_more = False
+    return has_more, cursor
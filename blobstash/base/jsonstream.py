@@ -0,0 +1,117 @@
+"""Incremental decoding of JSON responses, the items of an array are decoded one by one as they're read."""
+import codecs
+import json
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = frozenset(" \t\n\r")
+# Characters that can follow the longest valid prefix of an incomplete number (e.g. "1." or "2e")
+_NUMBER_CONTINUATION = frozenset(".eE+-")
+
+
+class JSONStream:
+    """Decode a JSON object from an iterable of bytes chunks (e.g. `requests.Response.iter_content`).
+
+    Iterating over it yields the items of the `key` array as soon as they're decoded, the other top-level keys are
+    stored in `resp` as they're read (a key sent after the array is only available once the array is consumed).
+
+    Only the current item (and the chunk being read) is kept in memory, not the whole response body.
+
+    """
+
+    def __init__(self, chunks, key="data"):
+        self.key = key
+        self.resp = {}
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size=1):
+        """Buffer at least `size` more characters, returns `False` if the stream is exhausted."""
+        if self._eof:
+            return False
+        consumed = self._pos
+        if consumed:
+            self._buf = self._buf[consumed:]
+            self._pos = 0
+
+        target = len(self._buf) + size
+        while len(self._buf) < target:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self._buf += self._decoder.decode(b"", final=True)
+                self._eof = True
+                return True
+            self._buf += self._decoder.decode(chunk)
+        return True
+
+    def _error(self, msg):
+        return json.JSONDecodeError(msg, self._buf, self._pos)
+
+    def _peek(self):
+        """Skip the whitespaces and returns the next character."""
+        while 1:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                raise self._error("Unexpected end of data")
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c not in chars:
+            raise self._error("Expecting {!r}".format(chars))
+        self._pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while 1:
+            try:
+                value, end = _DECODER.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # The value is incomplete, read at least as much data as currently buffered before trying again
+                if not self._fill(max(len(self._buf) - self._pos, 1)):
+                    raise
+                continue
+
+            # A number may continue in the next chunk
+            if end == len(self._buf) or (
+                isinstance(value, (int, float))
+                and self._buf[end] in _NUMBER_CONTINUATION
+            ):
+                if self._fill():
+                    continue
+
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+
+        while 1:
+            key = self._value()
+            if not isinstance(key, str):
+                raise self._error("Expecting property name")
+            self._expect(":")
+            if key == self.key:
+                self._expect("[")
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while 1:
+                        yield self._value()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                self.resp[key] = self._value()
+
+            if self._expect(",}") == "}":
+                return
@@ -2,6 +2,7 @@ import base64
 
 from requests import HTTPError
 
+from blobstash.base.client import DEFAULT_TIMEOUT
 from blobstash.base.client import Client
 from blobstash.base.error import BlobStashError
 from blobstash.base.iterator import BasePaginationIterator
@@ -49,13 +50,8 @@ class KeysIterator(BasePaginationIterator):
     def __init__(self, client, **kwargs):
         super().__init__(client=client, path="/api/kvstore/keys", **kwargs)
 
-    def parse_data(self, resp):
-        raw_keys = resp["data"]
-        keys = []
-        for data in raw_keys:
-            keys.append(KeyValue(**data))
-
-        return keys
+    def parse_item(self, item, resp):
+        return KeyValue(**item)
 
 
 class KeyVersionsIterator(BasePaginationIterator):
@@ -65,22 +61,19 @@ class KeyVersionsIterator(BasePaginationIterator):
             client=client, path="/api/kvstore/key/" + self.key + "/_versions", **kwargs
         )
 
-    def parse_data(self, resp):
-        raw_keys = resp["data"]
-        keys = []
-        for data in raw_keys:
-            keys.append(KeyValue(**data))
-
-        return keys
+    def parse_item(self, item, resp):
+        return KeyValue(**item)
 
 
 class KVStoreClient:
-    def __init__(self, base_url=None, api_key=None, client=None):
+    def __init__(
+        self, base_url=None, api_key=None, client=None, timeout=DEFAULT_TIMEOUT
+    ):
         if client:
             self._client = client
             return
 
-        self._client = Client(base_url=base_url, api_key=api_key)
+        self._client = Client(base_url=base_url, api_key=api_key, timeout=timeout)
 
     def put(self, key, data, ref="", version=-1):
         # XXX(tsileo): check with `ref` and `data` as None
@@ -0,0 +1,139 @@
+"""Client-side concurrency limiter and token-bucket rate limiting, with separate budgets for reads and writes."""
+import threading
+import time
+from contextlib import contextmanager
+
+READ_VERBS = frozenset(["GET", "HEAD", "OPTIONS"])
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `burst` tokens (defaults to `rate`).
+
+    Acquiring more tokens than available puts the bucket in debt, and the caller waits until it's paid back, this way
+    a single request bigger than the burst (e.g. a large blob) still goes through.
+
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Take tokens from the bucket, waiting if needed."""
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    def charge(self, tokens):
+        """Take tokens without waiting, the next caller will wait for the debt to be paid back."""
+        self._reserve(tokens)
+
+
+class Budget:
+    """Limits for a class of requests: max in-flight requests, requests per second and bytes per second."""
+
+    def __init__(
+        self,
+        max_in_flight=None,
+        requests_per_second=None,
+        bytes_per_second=None,
+        burst_requests=None,
+        burst_bytes=None,
+    ):
+        self.max_in_flight = max_in_flight
+        self._in_flight = (
+            threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        )
+        self._requests = None
+        if requests_per_second:
+            self._requests = TokenBucket(requests_per_second, burst_requests)
+        self._bytes = None
+        if bytes_per_second:
+            self._bytes = TokenBucket(bytes_per_second, burst_bytes)
+
+    @contextmanager
+    def acquire(self, size=0):
+        if self._requests:
+            self._requests.acquire()
+        if self._bytes and size:
+            self._bytes.acquire(size)
+        if self._in_flight:
+            self._in_flight.acquire()
+        try:
+            yield
+        finally:
+            if self._in_flight:
+                self._in_flight.release()
+
+    def charge(self, size):
+        """Account for bytes only known once the request is done (e.g. a response body)."""
+        if self._bytes and size:
+            self._bytes.charge(size)
+
+
+class Limiter:
+    """Limiter shared by all the clients of a BlobStash instance (see `blobstash.base.client.set_limiter`).
+
+    `reads` (GET/HEAD/OPTIONS) and `writes` are separate `Budget`, so background writes cannot starve interactive reads,
+    and `max_in_flight` caps the total number of in-flight requests. Bytes are counted on the request body for writes
+    and on the response body for reads.
+
+    """
+
+    def __init__(self, reads=None, writes=None, max_in_flight=None):
+        self.reads = reads or Budget()
+        self.writes = writes or Budget()
+        self._in_flight = (
+            threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        )
+
+    def budget(self, verb):
+        if verb in READ_VERBS:
+            return self.reads
+        return self.writes
+
+    @contextmanager
+    def limit(self, verb, size=0):
+        """Wait for the request to be allowed, and hold an in-flight slot until the context exits."""
+        with self.budget(verb).acquire(size):
+            if self._in_flight:
+                self._in_flight.acquire()
+            try:
+                yield
+            finally:
+                if self._in_flight:
+                    self._in_flight.release()
+
+
+def request_size(kwargs):
+    """Returns the size of the body for the given `requests` kwargs, or 0 if it's unknown (e.g. streamed)."""
+    data = kwargs.get("data")
+    if isinstance(data, (bytes, bytearray, str)):
+        return len(data)
+    # Streamed body with a known size (e.g. `blobstash.base.blobstore.MultipartBody`)
+    if hasattr(data, "content_length"):
+        return data.content_length
+
+    files = kwargs.get("files")
+    if isinstance(files, dict):
+        files = files.items()
+    size = 0
+    for _, value in files or []:
+        if isinstance(value, tuple):
+            value = value[1]
+        if isinstance(value, (bytes, bytearray, str)):
+            size += len(value)
+    return size
@@ -0,0 +1,252 @@
+"""Opt-in client metrics, grouped by endpoint template, and exportable as Prometheus text."""
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+# Latency histogram buckets (in seconds)
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+_ENDPOINT_TEMPLATES = [
+    (re.compile(r"^/api/blobstore/blob/[^/]+$"), "/api/blobstore/blob/{hash}"),
+    (
+        re.compile(r"^/api/kvstore/key/.+/_versions$"),
+        "/api/kvstore/key/{key}/_versions",
+    ),
+    (re.compile(r"^/api/kvstore/key/.+$"), "/api/kvstore/key/{key}"),
+    (
+        re.compile(r"^/api/docstore/[^/]+/[^/]+/_versions$"),
+        "/api/docstore/{col}/{id}/_versions",
+    ),
+    (
+        re.compile(r"^/api/docstore/[^/]+/_map_reduce$"),
+        "/api/docstore/{col}/_map_reduce",
+    ),
+    (re.compile(r"^/api/docstore/[^/]+/[^/]+$"), "/api/docstore/{col}/{id}"),
+    (re.compile(r"^/api/docstore/[^/]+$"), "/api/docstore/{col}"),
+    (
+        re.compile(r"^/api/filetree/fs/fs/[^/]+(/.*)?$"),
+        "/api/filetree/fs/fs/{name}/{path}",
+    ),
+    (
+        re.compile(r"^/api/filetree/fs/ref/[^/]+(/.*)?$"),
+        "/api/filetree/fs/ref/{ref}/{path}",
+    ),
+    (re.compile(r"^/api/filetree/file/[^/]+$"), "/api/filetree/file/{ref}"),
+    (re.compile(r"^/api/filetree/node/[^/]+$"), "/api/filetree/node/{ref}"),
+]
+
+
+def endpoint_template(path):
+    """Returns the endpoint template for the given API path (e.g. `/api/blobstore/blob/{hash}`)."""
+    path = path.split("?", 1)[0]
+    for regex, template in _ENDPOINT_TEMPLATES:
+        if regex.match(path):
+            return template
+
+    return path
+
+
+def body_size(body):
+    """Returns the size of a request/response body, or 0 if it's unknown (e.g. streamed)."""
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    if hasattr(body, "content_length"):
+        return body.content_length
+
+    return 0
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus style)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating inside the matching bucket."""
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    # Above the last bucket, the best estimate is the last bound
+                    return self.buckets[-1]
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            if i < len(self.buckets):
+                lower = self.buckets[i]
+
+        return self.buckets[-1]
+
+
+class EndpointStats:
+    """Stats for a single (method, endpoint template)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.latency = Histogram(buckets)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.status_codes = Counter()
+
+    @property
+    def count(self):
+        return self.latency.count
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            latency_sum=self.latency.sum,
+            p50=self.latency.quantile(0.5),
+            p95=self.latency.quantile(0.95),
+            p99=self.latency.quantile(0.99),
+            request_bytes=self.request_bytes,
+            response_bytes=self.response_bytes,
+            status_codes=dict(self.status_codes),
+        )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join('{}="{}"'.format(k, _escape(v)) for k, v in labels.items())
+
+
+class Metrics:
+    """Thread-safe metrics store for `Client`/`AsyncClient` (`Client(metrics=Metrics())`).
+
+    Requests are grouped by method and endpoint template. Failed requests (i.e. no response) are recorded with the
+    "error" status.
+
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, namespace="blobstash_client"):
+        self.buckets = tuple(buckets)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(
+        self, method, path, status, duration, request_bytes=0, response_bytes=0
+    ):
+        key = (method, endpoint_template(path))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats(self.buckets)
+            stats.latency.observe(duration)
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.status_codes[status] += 1
+
+    def get(self, method, endpoint):
+        """Returns the stats (as a dict) for the given method and endpoint template, or `None`."""
+        with self._lock:
+            stats = self._stats.get((method, endpoint))
+            if stats is None:
+                return None
+            return stats.to_dict()
+
+    def snapshot(self):
+        """Returns all the stats as a dict keyed by `(method, endpoint template)`."""
+        with self._lock:
+            return {key: stats.to_dict() for key, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def to_prometheus(self):
+        """Export the metrics in the Prometheus text exposition format."""
+        ns = self.namespace
+        requests = [
+            "# HELP {}_requests_total Requests sent to BlobStash.".format(ns),
+            "# TYPE {}_requests_total counter".format(ns),
+        ]
+        latency = [
+            "# HELP {}_request_duration_seconds Requests latency.".format(ns),
+            "# TYPE {}_request_duration_seconds histogram".format(ns),
+        ]
+        sent = [
+            "# HELP {}_request_bytes_total Bytes sent.".format(ns),
+            "# TYPE {}_request_bytes_total counter".format(ns),
+        ]
+        received = [
+            "# HELP {}_response_bytes_total Bytes received.".format(ns),
+            "# TYPE {}_response_bytes_total counter".format(ns),
+        ]
+        with self._lock:
+            for (method, endpoint), stats in sorted(self._stats.items()):
+                labels = _labels(method=method, endpoint=endpoint)
+                for status, count in sorted(
+                    stats.status_codes.items(), key=lambda item: str(item[0])
+                ):
+                    requests.append(
+                        '{}_requests_total{{{},status="{}"}} {}'.format(
+                            ns, labels, status, count
+                        )
+                    )
+
+                cumulative = 0
+                for bound, count in zip(
+                    self.buckets + (float("inf"),), stats.latency.counts
+                ):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    latency.append(
+                        '{}_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                            ns, labels, le, cumulative
+                        )
+                    )
+                latency.append(
+                    "{}_request_duration_seconds_sum{{{}}} {}".format(
+                        ns, labels, stats.latency.sum
+                    )
+                )
+                latency.append(
+                    "{}_request_duration_seconds_count{{{}}} {}".format(
+                        ns, labels, stats.latency.count
+                    )
+                )
+                sent.append(
+                    "{}_request_bytes_total{{{}}} {}".format(
+                        ns, labels, stats.request_bytes
+                    )
+                )
+                received.append(
+                    "{}_response_bytes_total{{{}}} {}".format(
+                        ns, labels, stats.response_bytes
+                    )
+                )
+
+        return "\n".join(requests + latency + sent + received) + "\n"
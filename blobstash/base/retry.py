@@ -0,0 +1,174 @@
+"""Retry (with jittered exponential backoff) and hedging policies for idempotent requests."""
+import random
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+IDEMPOTENT_VERBS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+# 500 is not retried as BlobStash may also return it for missing FileTree nodes
+RETRYABLE_STATUS_CODES = frozenset([429, 502, 503, 504])
+
+
+class RetryPolicy:
+    """Retry policy for idempotent requests failing with a connection error or a retryable status code.
+
+    The delay before the nth retry is picked randomly between 0 and `min(max_backoff, backoff * 2 ** n)` ("full
+    jitter"), a `Retry-After` header (in seconds) is honored when it's longer.
+
+    """
+
+    def __init__(
+        self,
+        max_attempts=3,
+        backoff=0.05,
+        max_backoff=2.0,
+        status_codes=RETRYABLE_STATUS_CODES,
+        verbs=IDEMPOTENT_VERBS,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.status_codes = frozenset(status_codes)
+        self.verbs = frozenset(verbs)
+
+    def should_retry(self, verb, attempt):
+        """Returns `True` if the request can be tried again after its attempt-th failure (starting at 1)."""
+        return verb in self.verbs and attempt < self.max_attempts
+
+    def delay(self, attempt, retry_after=None):
+        """Returns the number of seconds to wait before the next attempt."""
+        delay = random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        )
+        if retry_after:
+            try:
+                delay = max(delay, min(self.max_backoff, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+
+class HedgePolicy:
+    """Hedging policy for reads: if a request has not completed after `delay` seconds, a second identical request is
+    sent and the first response wins.
+
+    Without a fixed `delay`, the delay is the `quantile` (e.g. p95) of the last `window` observed latencies, hedging
+    only starts once `min_samples` latencies have been observed.
+
+    """
+
+    def __init__(
+        self, delay=None, quantile=0.95, min_samples=20, window=1000, max_workers=16
+    ):
+        self.fixed_delay = delay
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies = deque(maxlen=window)
+        self._delay = None
+        self._since_update = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def observe(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+            self._since_update += 1
+
+    def delay(self):
+        """Returns the hedging delay, or `None` if there isn't enough samples yet."""
+        if self.fixed_delay is not None:
+            return self.fixed_delay
+
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+
+            # The quantile is only recomputed every `min_samples` observations
+            if self._delay is None or self._since_update >= self.min_samples:
+                latencies = sorted(self._latencies)
+                index = min(len(latencies) - 1, int(self.quantile * len(latencies)))
+                self._delay = latencies[index]
+                self._since_update = 0
+
+            return self._delay
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="blobstash-hedge"
+                )
+            return self._executor
+
+    def run(self, send):
+        """Call `send` (returning a `requests.Response`), and hedge it if it's too slow."""
+        delay = self.delay()
+        if delay is None:
+            return send()
+
+        first = self.executor.submit(send)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        self._incr("hedged")
+        second = self.executor.submit(send)
+        pending = {first, second}
+        while 1:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done if future.exception() is None]
+            if succeeded or not pending:
+                winner = succeeded[0] if succeeded else done.pop()
+                # Release the connection used by the slower request once it completes
+                for other in pending | (done - {winner}):
+                    other.add_done_callback(_close_response)
+                if winner is second:
+                    self._incr("hedge_wins")
+                return winner.result()
+
+    async def run_async(self, send):
+        """asyncio version of `run`, `send` is a coroutine function returning an `aiohttp.ClientResponse`."""
+        import asyncio
+
+        delay = self.delay()
+        if delay is None:
+            return await send()
+
+        first = asyncio.ensure_future(send())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self._incr("hedged")
+        second = asyncio.ensure_future(send())
+        pending = {first, second}
+        while 1:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            succeeded = [future for future in done if future.exception() is None]
+            if succeeded or not pending:
+                winner = succeeded[0] if succeeded else done.pop()
+                for other in pending:
+                    other.cancel()
+                for other in done - {winner}:
+                    _close_response(other)
+                if winner is second:
+                    self._incr("hedge_wins")
+                return winner.result()
+
+    def _incr(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
@@ -0,0 +1,89 @@
+"""Latency-aware routing across several BlobStash replicas, with ejection of unhealthy nodes."""
+import random
+import threading
+import time
+
+from blobstash.base.unixsocket import UNIX_ROOT_URL
+from blobstash.base.unixsocket import socket_path
+
+# Statuses meaning the node itself is unhealthy (and not that the request is invalid)
+UNHEALTHY_STATUS_CODES = frozenset([502, 503, 504])
+
+
+class Endpoint:
+    """A BlobStash node, along with its observed latency (EWMA) and health."""
+
+    def __init__(self, base_url, session):
+        self.base_url = base_url
+        self.root_url = UNIX_ROOT_URL if socket_path(base_url) else base_url
+        self.session = session
+        self.ewma = None
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def is_healthy(self, now):
+        return self.ejected_until <= now
+
+    def score(self):
+        # Nodes without samples yet are tried first, in-flight requests penalize busy nodes
+        return (self.ewma or 0.0) * (self.in_flight + 1)
+
+    def __repr__(self):
+        return "blobstash.base.routing.Endpoint(base_url={!r}, ewma={!r})".format(
+            self.base_url, self.ewma
+        )
+
+
+class EndpointPool:
+    """Pick the node for each request: reads go to the best of two random healthy nodes (power of two choices on the
+    latency EWMA), writes are pinned to the primary (the first node).
+
+    A node failing `max_failures` times in a row is ejected for `ejection_time` seconds, after which it's probed again
+    by the next read routed to it.
+
+    """
+
+    def __init__(self, endpoints, alpha=0.3, max_failures=3, ejection_time=30.0):
+        self.endpoints = list(endpoints)
+        self.primary = self.endpoints[0]
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def pick_read(self, exclude=()):
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        healthy = [e for e in candidates if e.is_healthy(now)]
+        # If every node is ejected, still try one instead of failing right away
+        candidates = healthy or candidates
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        return a if a.score() <= b.score() else b
+
+    def pick_write(self):
+        return self.primary
+
+    def start(self, endpoint):
+        with self._lock:
+            endpoint.in_flight += 1
+
+    def done(self, endpoint, latency, ok):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if ok:
+                endpoint.failures = 0
+                endpoint.ejected_until = 0.0
+                if endpoint.ewma is None:
+                    endpoint.ewma = latency
+                else:
+                    endpoint.ewma += self.alpha * (latency - endpoint.ewma)
+            else:
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.ejected_until = time.monotonic() + self.ejection_time
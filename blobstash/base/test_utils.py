@@ -1,7 +1,12 @@
 """Utils for unit tests, also used for BlobStash (and related projects) integrations tests."""
+
 import os
 import shutil
+import socketserver
+import threading
 import time
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
 from subprocess import Popen
 
 
@@ -35,3 +40,176 @@ class BlobStash(object):
         if self.process:
             self.process.terminate()
             self.process.wait()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = self._read_chunked()
+        else:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+        status, headers, data = self.server.handler(self.command, self.path, body)
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_chunked(self):
+        chunks = []
+        while 1:
+            size = int(self.rfile.readline().split(b";", 1)[0], 16)
+            if not size:
+                # Skip the trailers
+                while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    do_GET = do_POST = do_PATCH = do_DELETE = do_HEAD = _handle
+
+    def address_string(self):
+        # `client_address` is an empty string for Unix sockets
+        return "stub"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _TCPStubHandler(_StubHandler):
+    disable_nagle_algorithm = True
+
+
+class _ConnectionsCounter:
+    """Count the accepted connections (`connections`), e.g. to check that a client reuses them."""
+
+    connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+class _TCPStubServer(_ConnectionsCounter, socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # The default backlog (5) drops connections (retried after 1s+) when many clients connect at once
+    request_queue_size = 128
+
+
+class _UnixStubServer(
+    _ConnectionsCounter, socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class StubServer(object):
+    """Local stand-in HTTP server for tests that don't need a real BlobStash.
+
+    `handler(method, path, body)` must return a `(status, headers, body)` tuple. The server listens on a random local
+    TCP port, or on the Unix socket at `unix_socket` if set, `connections` is the number of connections accepted so
+    far.
+
+    """
+
+    def __init__(self, handler, unix_socket=None):
+        self.unix_socket = unix_socket
+        if unix_socket:
+            self.server = _UnixStubServer(unix_socket, _StubHandler)
+            self.base_url = "unix://" + unix_socket
+        else:
+            self.server = _TCPStubServer(("127.0.0.1", 0), _TCPStubHandler)
+            self.base_url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.server.handler = handler
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.unix_socket:
+            os.unlink(self.unix_socket)
+
+
+class FakePaginatedClient(object):
+    """In-memory stand-in for `Client` serving `total` items from a paginated API, for iterators benchmarks.
+
+    The items are (shallow copies of) `items`, repeated as needed, and each page takes `latency` seconds.
+
+    """
+
+    def __init__(self, items, total, latency=0.0, pointers=None):
+        self.items = items
+        self.total = total
+        self.latency = latency
+        self.pointers = pointers or {}
+        self.requests = 0
+        self.limits = []
+
+    def request(self, verb, path, params=None, **kwargs):
+        params = params or {}
+        start = int(params.get("cursor") or 0)
+        end = min(self.total, start + (params.get("limit") or 50))
+        self.requests += 1
+        self.limits.append(params.get("limit"))
+        time.sleep(self.latency)
+        data = [dict(self.items[i % len(self.items)]) for i in range(start, end)]
+        return {
+            "data": data,
+            "pagination": {
+                "has_more": end < self.total,
+                "cursor": str(end),
+                "count": len(data),
+            },
+            "pointers": self.pointers,
+        }
+
+
+# The benchmarks (throughput numbers, machine dependent) only run with `BLOBSTASH_BENCH=1`
+BENCH = bool(os.getenv("BLOBSTASH_BENCH"))
+# Number of items scanned by the iterators benchmarks (e.g. `BLOBSTASH_BENCH_ITEMS=1000000` for million-item scans)
+BENCH_ITEMS = int(os.getenv("BLOBSTASH_BENCH_ITEMS", "100000"))
+BENCH_PER_PAGE = 10000
+# Simulated latency per page, for both the server and the consumer (e.g. writing the items somewhere else)
+BENCH_LATENCY = 0.02
+
+
+def bench_scan(make_iterator, items):
+    """Scan `BENCH_ITEMS` items using the iterator returned by `make_iterator(client, prefetch)`, without and with
+    prefetch, and returns the items/s for each."""
+    results = {}
+    for prefetch in [0, 2]:
+        client = FakePaginatedClient(items, BENCH_ITEMS, latency=BENCH_LATENCY)
+        start = time.perf_counter()
+        count = 0
+        with make_iterator(client, prefetch) as iterator:
+            for _ in iterator:
+                count += 1
+                if count % BENCH_PER_PAGE == 0:
+                    time.sleep(BENCH_LATENCY)
+        elapsed = time.perf_counter() - start
+        if count != BENCH_ITEMS:
+            raise ValueError("scanned {} items, expected {}".format(count, BENCH_ITEMS))
+        results[prefetch] = count / elapsed
+    return results
+
+
+def bench_chunker(chunker, size=32 * 1024 * 1024):
+    """Returns the throughput (in MB/s) of `chunker.split` on `size` random bytes."""
+    data = os.urandom(size)
+    start = time.perf_counter()
+    for _ in chunker.split(data):
+        pass
+    return size / 1e6 / (time.perf_counter() - start)
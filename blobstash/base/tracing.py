@@ -0,0 +1,270 @@
+"""Tracing spans for the client hot paths, and a sampling profiler enabled with `BLOBSTASH_PROFILE`.
+
+Spans are only recorded once a tracer is set (`set_tracer`), any OpenTelemetry tracer works (e.g.
+`set_tracer(opentelemetry.trace.get_tracer("blobstash"))`), or a `RecordingTracer` to inspect them in-process.
+Without a tracer (and without the profiler), `span` returns a shared no-op context manager.
+
+Setting `BLOBSTASH_PROFILE` to a path (or `-` for stderr) starts a profiler sampling the threads inside a span every
+`BLOBSTASH_PROFILE_INTERVAL` milliseconds (5 by default), the samples per span and call site are dumped at exit.
+
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+_TRACER = None
+_PROFILER = None
+_ENABLED = False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "attributes", "_cm", "_span")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self._cm = None
+        self._span = None
+
+    def __enter__(self):
+        if _PROFILER is not None:
+            _PROFILER.push(self.name)
+        if _TRACER is not None:
+            self._cm = _TRACER.start_as_current_span(
+                self.name, attributes=self.attributes
+            )
+            self._span = self._cm.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        if _PROFILER is not None:
+            _PROFILER.pop()
+        if self._cm is not None:
+            return self._cm.__exit__(*exc_info)
+        return False
+
+    def set_attribute(self, key, value):
+        if self._span is not None:
+            self._span.set_attribute(key, value)
+
+
+def span(name, attributes=None):
+    """Returns a context manager for a span nested in the current one (if any)."""
+    if not _ENABLED:
+        return _NOOP_SPAN
+    return _Span(name, attributes)
+
+
+def set_tracer(tracer):
+    """Set the tracer used by the client (`None` to disable tracing), it must implement the OpenTelemetry
+    `start_as_current_span(name, attributes=None)` method."""
+    global _TRACER
+    _TRACER = tracer
+    _update_enabled()
+
+
+def get_tracer():
+    return _TRACER
+
+
+def _update_enabled():
+    global _ENABLED
+    _ENABLED = _TRACER is not None or _PROFILER is not None
+
+
+class RecordedSpan:
+    """Span recorded by a `RecordingTracer`."""
+
+    def __init__(self, name, attributes=None, parent=None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.children = []
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self):
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def walk(self):
+        """Iterate over the span and all its descendants."""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def __repr__(self):
+        return "blobstash.base.tracing.RecordedSpan(name={!r}, duration={!r})".format(
+            self.name, self.duration
+        )
+
+
+class RecordingTracer:
+    """Minimal in-process tracer keeping the spans tree (the root spans are in `spans`)."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        stack = self._local.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        recorded = RecordedSpan(name, attributes, parent)
+        if parent is not None:
+            parent.children.append(recorded)
+        else:
+            with self._lock:
+                self.spans.append(recorded)
+
+        stack.append(recorded)
+        try:
+            yield recorded
+        except BaseException as error:
+            recorded.set_attribute("error", repr(error))
+            raise
+        finally:
+            recorded.end = time.perf_counter()
+            stack.pop()
+
+    def summary(self):
+        """Returns the count and total duration of the spans, by name."""
+        summary = {}
+        with self._lock:
+            roots = list(self.spans)
+        for root in roots:
+            for recorded in root.walk():
+                if recorded.end is None:
+                    continue
+                stats = summary.setdefault(recorded.name, dict(count=0, total=0.0))
+                stats["count"] += 1
+                stats["total"] += recorded.duration
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+
+
+class SamplingProfiler:
+    """Sample the stack of the threads currently inside a span every `interval` seconds, and count the samples by
+    (innermost span, call site)."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def push(self, name):
+        self._stacks.setdefault(threading.get_ident(), []).append(name)
+
+    def pop(self):
+        stack = self._stacks.get(threading.get_ident())
+        if stack:
+            stack.pop()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="blobstash-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, stack in list(self._stacks.items()):
+                frame = frames.get(thread_id)
+                if not stack or frame is None:
+                    continue
+                code = frame.f_code
+                call_site = "{}:{} ({})".format(
+                    code.co_filename, frame.f_lineno, code.co_name
+                )
+                self.samples[(stack[-1], call_site)] += 1
+
+    def dump(self, out):
+        total = sum(self.samples.values()) or 1
+        out.write("samples     %  span / call site\n")
+        for (name, call_site), count in self.samples.most_common():
+            out.write(
+                "{:>7} {:>5.1f}  {} / {}\n".format(
+                    count, 100.0 * count / total, name, call_site
+                )
+            )
+
+
+def start_profiler(interval=0.005):
+    """Start the sampling profiler (only the code running inside spans is sampled), and returns it."""
+    global _PROFILER
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    _PROFILER = profiler
+    _update_enabled()
+    return profiler
+
+
+def stop_profiler():
+    """Stop the sampling profiler, and returns it."""
+    global _PROFILER
+    profiler = _PROFILER
+    _PROFILER = None
+    _update_enabled()
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def _dump_profile(output):
+    profiler = stop_profiler()
+    if profiler is None:
+        return
+    if output == "-":
+        profiler.dump(sys.stderr)
+    else:
+        with open(output, "w") as f:
+            profiler.dump(f)
+
+
+def _profile_from_env():
+    output = os.getenv("BLOBSTASH_PROFILE")
+    if not output:
+        return
+    interval = float(os.getenv("BLOBSTASH_PROFILE_INTERVAL", "5")) / 1000
+    start_profiler(interval)
+    atexit.register(_dump_profile, output)
+
+
+_profile_from_env()
@@ -0,0 +1,60 @@
+"""Unix domain socket transport, for BlobStash servers running on the same host (`unix:///path/to/blobstash.sock`)."""
+import socket
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+UNIX_SCHEME = "unix://"
+
+# Requests going through a Unix socket still need an HTTP URL (only the path matters)
+UNIX_ROOT_URL = "http://localhost"
+
+
+def socket_path(base_url):
+    """Returns the socket path if base_url is a `unix://` URL, `None` otherwise."""
+    if base_url.startswith(UNIX_SCHEME):
+        return base_url.replace(UNIX_SCHEME, "", 1)
+
+    return None
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, *args, socket_path=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class _UnixHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _UnixHTTPConnection
+
+
+class UnixAdapter(HTTPAdapter):
+    """Transport adapter sending every request to the Unix socket at path, with a single keep-alive pool."""
+
+    def __init__(self, path, **kwargs):
+        self.socket_path = path
+        super().__init__(**kwargs)
+        self._pool = _UnixHTTPConnectionPool(
+            "localhost",
+            maxsize=self._pool_maxsize,
+            block=self._pool_block,
+            socket_path=self.socket_path,
+        )
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._pool
+
+    def get_connection(self, url, proxies=None):
+        return self._pool
+
+    def close(self):
+        self._pool.close()
+        super().close()
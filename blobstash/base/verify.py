@@ -0,0 +1,116 @@
+"""Verification of the blobs content against their hash, offloaded to a thread pool (see `BlobStoreClient` `verify`)."""
+import threading
+import time
+
+from blobstash.base.blobstore import BlobHashMismatchError
+from blobstash.base.blobstore import _nbytes
+from blobstash.base.cache import blob_hash
+
+
+class HashVerifier:
+    """Check blobs hashes using up to `workers` threads (`hashlib` releases the GIL while hashing big buffers).
+
+    Small blobs are hashed in batches of about `batch_bytes` bytes (one task per batch instead of per blob), and a
+    blob bigger than `batch_bytes` gets its own task. When everything fits in a single batch smaller than
+    `batch_bytes`, it's hashed in the calling thread.
+
+    The counters (`blobs`, `bytes`, `seconds` spent hashing, and `mismatches`) are updated after each batch, and by
+    `record` for the blobs hashed elsewhere (e.g. on the fly by `BlobStoreClient.get_into`).
+
+    """
+
+    def __init__(self, workers=4, batch_bytes=256 * 1024):
+        self.workers = workers
+        self.batch_bytes = batch_bytes
+        self.blobs = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.mismatches = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def bytes_per_second(self):
+        """Hashing throughput (per worker)."""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def _batches(self, items):
+        batch = []
+        size = 0
+        for hash, data in items:
+            data_size = _nbytes(data)
+            if data_size >= self.batch_bytes:
+                yield [(hash, data)]
+                continue
+            batch.append((hash, data))
+            size += data_size
+            if size >= self.batch_bytes:
+                yield batch
+                batch = []
+                size = 0
+
+        if batch:
+            yield batch
+
+    def _check(self, batch):
+        """Returns the (hash, actual hash) of the blobs of the batch not matching their hash."""
+        start = time.perf_counter()
+        mismatches = []
+        size = 0
+        for hash, data in batch:
+            actual_hash = blob_hash(data)
+            if actual_hash != hash:
+                mismatches.append((hash, actual_hash))
+            size += _nbytes(data)
+
+        self.record(len(batch), size, time.perf_counter() - start, len(mismatches))
+        return mismatches
+
+    def record(self, blobs, size, seconds, mismatches=0):
+        """Update the counters with `blobs` blobs (`size` bytes) hashed in `seconds` seconds."""
+        with self._lock:
+            self.blobs += blobs
+            self.bytes += size
+            self.seconds += seconds
+            self.mismatches += mismatches
+
+    def verify(self, hash, data):
+        """Raise `BlobHashMismatchError` if `data` doesn't match `hash`."""
+        self.verify_many([(hash, data)])
+
+    def verify_many(self, items):
+        """Check the given (hash, data) tuples, and raise `BlobHashMismatchError` for the first mismatch."""
+        batches = list(self._batches(items))
+        if len(batches) == 1 and (
+            sum(_nbytes(data) for _, data in batches[0]) < self.batch_bytes
+        ):
+            results = [self._check(batches[0])]
+        else:
+            results = list(self._get_executor().map(self._check, batches))
+
+        for mismatches in results:
+            for hash, actual_hash in mismatches:
+                raise BlobHashMismatchError(hash, actual_hash)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="blobstash-verify"
+                )
+            return self._executor
+
+    def close(self):
+        """Stop the worker threads."""
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown()
+
+    def __repr__(self):
+        return "blobstash.base.verify.HashVerifier(blobs={!r}, bytes={!r}, mismatches={!r})".format(
+            self.blobs, self.bytes, self.mismatches
+        )
@@ -6,8 +6,10 @@ from datetime import datetime
 from datetime import timezone
 import json
 
+from blobstash.base.client import DEFAULT_TIMEOUT
 from blobstash.base.client import Client
 from blobstash.base.iterator import BasePaginationIterator
+from blobstash.base.tracing import span
 from blobstash.docstore.attachment import add_attachment
 from blobstash.docstore.attachment import fadd_attachment
 from blobstash.docstore.attachment import get_attachment as get_attach
@@ -21,9 +23,6 @@ from blobstash.docstore.query import LuaScript
 from blobstash.docstore.query import LuaShortQuery
 from blobstash.docstore.query import LuaStoredQuery
 from blobstash.docstore.query import LuaShortQueryComplex
-from blobstash.filetree import Node
-
-import jsonpatch
 
 # Keep a local cache of the docs to be able to generate a JSON Patch
 _DOC_CACHE: Dict[str, "_Document"] = {}
@@ -141,7 +140,21 @@ class ID:
 
 
 class DocVersionsIterator(BasePaginationIterator):
-    def __init__(self, client, col_name, _id, params=None, limit=None, cursor=None):
+    # The pointers are sent after the docs
+    item_requires = ("pointers",)
+
+    def __init__(
+        self,
+        client,
+        col_name,
+        _id,
+        params=None,
+        limit=None,
+        cursor=None,
+        deadline=None,
+        stream=False,
+        prefetch=0,
+    ):
         if isinstance(_id, ID):
             _id = _id.id()
 
@@ -153,21 +166,23 @@ class DocVersionsIterator(BasePaginationIterator):
             params=params,
             limit=limit,
             cursor=cursor,
+            deadline=deadline,
+            stream=stream,
+            prefetch=prefetch,
         )
 
     def parse_data(self, resp):
-        raw_docs = resp["data"]
-        docs = []
-        pointers = resp["pointers"]
-        for doc in raw_docs:
-            ID.inject(doc)
-            _fill_pointers(doc, pointers)
-            docs.append(_Document(doc))
+        with span("blobstash.docstore.fill_pointers", {"docs": len(resp["data"])}):
+            return super().parse_data(resp)
 
-        return docs
+    def parse_item(self, item, resp):
+        return _parse_doc(item, resp["pointers"])
 
 
 class DocsQueryIterator(BasePaginationIterator):
+    # The pointers are sent after the docs
+    item_requires = ("pointers",)
+
     def __init__(
         self,
         client,
@@ -181,6 +196,11 @@ class DocsQueryIterator(BasePaginationIterator):
         limit=None,
         cursor=None,
         per_page=None,
+        deadline=None,
+        stream=False,
+        prefetch=0,
+        checkpoint=None,
+        resume_from=None,
     ):
         self.query = query
         self.script = None
@@ -188,7 +208,6 @@ class DocsQueryIterator(BasePaginationIterator):
         self.collection = collection
         self.as_of = as_of
 
-        # XXX(tsileo): intelligent limit (i.e. limit=1000, but want to query them 100 by 100)
         # Handle raw Lua script
         if isinstance(query, LuaScript):
             script = query.script
@@ -224,16 +243,25 @@ class DocsQueryIterator(BasePaginationIterator):
             limit=limit,
             cursor=cursor,
             per_page=per_page,
+            deadline=deadline,
+            stream=stream,
+            prefetch=prefetch,
+            checkpoint=checkpoint,
+            resume_from=resume_from,
         )
 
     def parse_data(self, resp):
-        docs = []
-        pointers = resp["pointers"]
-        for raw_doc in resp["data"]:
-            ID.inject(raw_doc)
-            _fill_pointers(raw_doc, pointers)
-            docs.append(_Document(raw_doc))
-        return docs
+        with span("blobstash.docstore.fill_pointers", {"docs": len(resp["data"])}):
+            return super().parse_data(resp)
+
+    def parse_item(self, item, resp):
+        return _parse_doc(item, resp["pointers"])
+
+
+def _parse_doc(raw_doc, pointers):
+    ID.inject(raw_doc)
+    _fill_pointers(raw_doc, pointers)
+    return _Document(raw_doc)
 
 
 def _fill_pointers(doc, pointers):
@@ -244,10 +272,14 @@ def _fill_pointers(doc, pointers):
     for k, v in doc.items():
         if isinstance(v, str):
             if v.startswith("@filetree/ref:"):
+                from blobstash.filetree import Node
+
                 doc[k] = Attachment(v, Node.from_resp(pointers[v]))
         elif isinstance(v, dict):
             _fill_pointers(v, pointers)
         elif isinstance(v, list):
+            from blobstash.filetree import Node
+
             doc[k] = [
                 Attachment(item, Node.from_resp(pointers[item]))
                 if isinstance(item, str) and item.startswith("@filetree/ref:")
@@ -297,12 +329,17 @@ class Collection:
             raise MissingIDError
         del doc["_id"]
         if _id in _DOC_CACHE:
+            # Only imported when needed as it's slow to import
+            import jsonpatch
+
             src = _DOC_CACHE[_id]
-            pdoc = json.loads(json.dumps(doc, cls=JSONEncoder))
-            p = jsonpatch.make_patch(src, pdoc)
-            del _DOC_CACHE[_id]
+            codec = self._client.codec
+            with span("blobstash.docstore.jsonpatch"):
+                pdoc = codec.loads(codec.dumps(doc))
+                p = jsonpatch.make_patch(src, pdoc)
+                del _DOC_CACHE[_id]
 
-            js = p.to_string()
+                js = codec.dumps(p.patch)
 
             resp = self._client.request(
                 "PATCH",
@@ -339,13 +376,21 @@ class Collection:
         resp = self._client.request("GET", "/api/docstore/" + self.name + "/" + _id)
         doc = resp["data"]
         pointers = resp["pointers"]
-        _id = ID.inject(doc)
-        _fill_pointers(doc, pointers)
+        with span("blobstash.docstore.fill_pointers", {"docs": 1}):
+            _id = ID.inject(doc)
+            _fill_pointers(doc, pointers)
 
         return _Document(doc)
 
-    def get_versions(self, _id):
-        return DocVersionsIterator(self._client, self.name, _id)
+    def get_versions(self, _id, deadline=None, stream=False, prefetch=0):
+        return DocVersionsIterator(
+            self._client,
+            self.name,
+            _id,
+            deadline=deadline,
+            stream=stream,
+            prefetch=prefetch,
+        )
 
         if isinstance(_id, ID):
             _id = _id.id()
@@ -404,8 +449,28 @@ class Collection:
         limit=None,
         cursor=None,
         per_page=None,
+        deadline=None,
+        stream=False,
+        prefetch=0,
+        checkpoint=None,
+        resume_from=None,
     ):
-        """Query the collection and return an iterable cursor."""
+        """Query the collection and return an iterable cursor.
+
+        `deadline` (a `blobstash.base.deadline.Deadline` or a number of seconds) bounds the time spent fetching all the
+        pages.
+
+        With `stream`, the pages are decoded incrementally, the documents are still buffered until the page pointers
+        are received (they're sent after the documents). With `prefetch`, up to `prefetch` pages are fetched in the
+        background while the current one is consumed.
+
+        `per_page` is the number of documents per page (e.g. `limit=1000, per_page=100` fetches 10 pages), it can also
+        be a `blobstash.base.iterator.AdaptivePageSize` to adjust it to the documents size.
+
+        With `checkpoint` (a local file path), the scan position is saved after each page, and the query can be
+        restarted with `resume_from` after a crash (see `blobstash.base.iterator.BasePaginationIterator`).
+
+        """
         return DocsQueryIterator(
             self._client,
             self,
@@ -416,6 +481,12 @@ class Collection:
             as_of=as_of,
             limit=limit,
             cursor=cursor,
+            per_page=per_page,
+            deadline=deadline,
+            stream=stream,
+            prefetch=prefetch,
+            checkpoint=checkpoint,
+            resume_from=resume_from,
         )
 
     def get(self, query="", script=""):
@@ -435,10 +506,18 @@ class Collection:
 class DocStoreClient:
     """BlobStash DocStore client."""
 
-    def __init__(self, base_url: str = None, api_key: str = None) -> None:
-        self._client = Client(
-            base_url=base_url, api_key=api_key, json_encoder=JSONEncoder
-        )
+    def __init__(
+        self,
+        base_url: str = None,
+        api_key: str = None,
+        client: Optional[Client] = None,
+        timeout=DEFAULT_TIMEOUT,
+    ) -> None:
+        if client:
+            self._client = client
+            return
+
+        self._client = Client(base_url=base_url, api_key=api_key, timeout=timeout)
 
     def __getitem__(self, key):
         return self.collection(key)
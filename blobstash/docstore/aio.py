@@ -0,0 +1,272 @@
+"""asyncio DocStore client, requires `aiohttp` (`pip install blobstash[async]`)."""
+from copy import deepcopy
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from uuid import uuid4
+
+from blobstash.base.aio import AsyncClient
+from blobstash.base.aio import AsyncPaginationMixin
+from blobstash.docstore import _DOC_CACHE
+from blobstash.docstore import DocsQueryIterator
+from blobstash.docstore import DocVersionsIterator
+from blobstash.docstore import ID
+from blobstash.docstore import MissingIDError
+from blobstash.docstore import NotADocumentError
+from blobstash.docstore import _Document
+from blobstash.docstore import _fill_pointers
+from blobstash.docstore.attachment import _FILETREE_ATTACHMENT_FS_PREFIX
+from blobstash.docstore.attachment import _FILETREE_POINTER_FMT
+from blobstash.docstore.attachment import Attachment
+from blobstash.docstore.error import DocStoreError
+from blobstash.docstore.query import LuaScript
+from blobstash.filetree.aio import AsyncFileTreeClient
+
+
+class AsyncDocVersionsIterator(AsyncPaginationMixin, DocVersionsIterator):
+    pass
+
+
+class AsyncDocsQueryIterator(AsyncPaginationMixin, DocsQueryIterator):
+    pass
+
+
+class AsyncCollection:
+    """Collection represents a collection (analog to a database)."""
+
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+    async def insert(self, doc):
+        """Insert the given document."""
+        if not isinstance(doc, dict):
+            raise NotADocumentError
+
+        if "_id" in doc and isinstance(doc["_id"], ID):
+            return await self.update(doc)
+
+        resp = await self._client.request(
+            "POST", "/api/docstore/" + self.name, json=doc
+        )
+        doc_id = ID.inject(resp)
+
+        doc["_id"] = doc_id
+        rdoc = doc.copy()
+        del rdoc["_id"]
+
+        _DOC_CACHE[doc_id] = deepcopy(rdoc)
+
+        return doc_id
+
+    async def update(self, doc):
+        """Update the given document."""
+        _id = doc.get("_id")
+        if _id is None:
+            raise MissingIDError
+        del doc["_id"]
+        if _id in _DOC_CACHE:
+            import jsonpatch
+
+            src = _DOC_CACHE[_id]
+            codec = self._client.codec
+            pdoc = codec.loads(codec.dumps(doc))
+            p = jsonpatch.make_patch(src, pdoc)
+            del _DOC_CACHE[_id]
+
+            resp = await self._client.request(
+                "PATCH",
+                "/api/docstore/" + self.name + "/" + _id.id(),
+                headers={"If-Match": _id.version()},
+                data=codec.dumps(p.patch),
+            )
+        else:
+            resp = await self._client.request(
+                "POST",
+                "/api/docstore/" + self.name + "/" + _id.id(),
+                headers={"If-Match": _id.version()},
+                json=doc,
+            )
+
+        doc_id = ID.inject(resp)
+        doc["_id"] = doc_id
+        rdoc = doc.copy()
+        del rdoc["_id"]
+        _DOC_CACHE[doc_id] = deepcopy(rdoc)
+        return doc_id
+
+    async def get_by_id(self, _id):
+        """Fetch a document by its ID (string, a an `ID` instance)."""
+        if isinstance(_id, ID):
+            _id = _id.id()
+
+        resp = await self._client.request(
+            "GET", "/api/docstore/" + self.name + "/" + _id
+        )
+        doc = resp["data"]
+        pointers = resp["pointers"]
+        ID.inject(doc)
+        _fill_pointers(doc, pointers)
+
+        return _Document(doc)
+
+    def get_versions(self, _id):
+        return AsyncDocVersionsIterator(self._client, self.name, _id)
+
+    async def delete(self, doc_or_docs):
+        """Delete the given document/list of document."""
+        docs = doc_or_docs
+        if not isinstance(doc_or_docs, list):
+            docs = [doc_or_docs]
+
+        for doc in docs:
+            if isinstance(doc, dict):
+                try:
+                    _id = doc["_id"].id()
+                except KeyError:
+                    raise MissingIDError
+            elif isinstance(doc, ID):
+                _id = doc.id()
+            elif isinstance(doc, str):
+                _id = doc
+            else:
+                raise NotADocumentError
+
+            await self._client.request(
+                "DELETE", "/api/docstore/" + self.name + "/" + _id
+            )
+
+    async def map_reduce(
+        self, map_: LuaScript, reduce_: LuaScript, as_of: str = ""
+    ) -> Dict[str, Dict[str, Any]]:
+        payload = {"map": map_.script, "reduce": reduce_.script}
+        resp = await self._client.request(
+            "POST", f"/api/docstore/{self.name}/_map_reduce?as_of={as_of}", json=payload
+        )
+        return resp["data"]
+
+    def query(
+        self,
+        query=None,
+        script=None,
+        stored_query=None,
+        stored_query_args=None,
+        as_of=None,
+        limit=None,
+        cursor=None,
+        per_page=None,
+    ):
+        """Query the collection and return an async iterable cursor."""
+        return AsyncDocsQueryIterator(
+            self._client,
+            self,
+            query,
+            script=script,
+            stored_query=stored_query,
+            stored_query_args=stored_query_args,
+            as_of=as_of,
+            limit=limit,
+            cursor=cursor,
+            per_page=per_page,
+        )
+
+    async def get(self, query="", script=""):
+        """Return the first document matching the query."""
+        async for doc in self.query(query, script=script, limit=1):
+            return doc
+
+        return None
+
+    def __repr__(self):
+        return "blobstash.docstore.aio.AsyncCollection(name={!r})".format(self.name)
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class AsyncDocStoreClient:
+    """BlobStash DocStore asyncio client."""
+
+    def __init__(self, base_url=None, api_key=None, client=None) -> None:
+        if client:
+            self._client = client
+            return
+
+        self._client = AsyncClient(base_url=base_url, api_key=api_key)
+
+    async def close(self):
+        await self._client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def __getitem__(self, key):
+        return self.collection(key)
+
+    def __getattr__(self, name):
+        return self.collection(name)
+
+    def collection(self, name):
+        """Returns an `AsyncCollection` instance for the given name."""
+        return AsyncCollection(self._client, name)
+
+    async def collections(self):
+        """Returns all the available collections."""
+        collections = []
+        resp = await self._client.request("GET", "/api/docstore/")
+        for col in resp["collections"]:
+            collections.append(self.collection(col))
+        return collections
+
+    async def fadd_attachment(self, name=None, fileobj=None, content_type=None):
+        """Creates a new attachment from the fileobj content with name as filename and returns a pointer object."""
+        node = await AsyncFileTreeClient(client=self._client).fput_node(
+            name, fileobj, content_type
+        )
+        return Attachment(_FILETREE_POINTER_FMT.format(node.ref), node)
+
+    async def add_attachment(self, path):
+        """Upload the file/dir at path, and return the key to embed the file/dir as an attachment/filetree pointer."""
+        p = Path(path)
+        filetree = AsyncFileTreeClient(client=self._client)
+        if p.is_file():
+            with open(p.absolute(), "rb") as fileobj:
+                node = await filetree.fput_node(p.name, fileobj)
+        else:
+            fs = filetree.fs(uuid4().hex, prefix=_FILETREE_ATTACHMENT_FS_PREFIX)
+            await fs.upload(path)
+            node = await fs.node()
+
+        return Attachment(_FILETREE_POINTER_FMT.format(node.ref), node)
+
+    async def fget_attachment(self, attachment):
+        """Returns an `AsyncNodeReader` (that needs to be closed) with the content off the attachment."""
+        node = attachment.node
+        if node.is_dir():
+            raise DocStoreError(
+                "cannot get a fileobj for a directory, please use get_attachment instead"
+            )
+
+        return await AsyncFileTreeClient(client=self._client).fget_node(node)
+
+    async def get_attachment(self, attachment, path):
+        node = attachment.node
+        filetree = AsyncFileTreeClient(client=self._client)
+        if node.is_file():
+            await filetree.get_node(node, path)
+            return
+
+        await filetree.fs(ref=node.ref, prefix=_FILETREE_ATTACHMENT_FS_PREFIX).download(
+            path
+        )
+
+    def __repr__(self):
+        return "blobstash.docstore.aio.AsyncDocStoreClient(base_url={!r})".format(
+            self._client.base_url
+        )
+
+    def __str__(self):
+        return self.__repr__()
@@ -1,9 +1,8 @@
 """Attachment utils."""
 from pathlib import Path
-from uuid import uuid4
 
+from blobstash.base.codec import register_type
 from blobstash.docstore.error import DocStoreError
-from blobstash.filetree import FileTreeClient
 
 _FILETREE_POINTER_FMT = "@filetree/ref:{}"
 _FILETREE_ATTACHMENT_FS_PREFIX = "_filetree:docstore"
@@ -22,8 +21,16 @@ class Attachment:
         )
 
 
+# Attachments are encoded as their pointer in the JSON documents
+register_type(Attachment, lambda attachment: attachment.pointer)
+
+
 def add_attachment(client, path):
     """Creates a new attachment (i.e. upload the file or directory to FileTree), and returns a pointer object."""
+    from uuid import uuid4
+
+    from blobstash.filetree import FileTreeClient
+
     p = Path(path)
     if p.is_file():
         with open(p.absolute(), "rb") as fileobj:
@@ -43,6 +50,8 @@ def add_attachment(client, path):
 
 def fadd_attachment(client, name, fileobj, content_type=None):
     """Creates a new attachment from the fileobj content with name as filename and returns a pointer object."""
+    from blobstash.filetree import FileTreeClient
+
     node = FileTreeClient(client=client).fput_node(name, fileobj, content_type)
     pointer = _FILETREE_POINTER_FMT.format(node.ref)
     return Attachment(pointer, node)
@@ -50,6 +59,8 @@ def fadd_attachment(client, name, fileobj, content_type=None):
 
 def fget_attachment(client, attachment):
     """Returns a fileobj (that needs to be closed) with the content off the attachment."""
+    from blobstash.filetree import FileTreeClient
+
     node = attachment.node
     if node.is_dir():
         raise DocStoreError(
@@ -60,6 +71,8 @@ def fget_attachment(client, attachment):
 
 
 def get_attachment(client, attachment, path):
+    from blobstash.filetree import FileTreeClient
+
     node = attachment.node
     if node.is_file():
         FileTreeClient(client=client).get_node(node, path)
@@ -2,8 +2,11 @@ import os
 from pathlib import Path
 from hashlib import blake2b
 
+from blobstash.base.client import DEFAULT_TIMEOUT
 from blobstash.base.client import Client
+from blobstash.base.deadline import as_deadline
 from blobstash.base.error import BlobStashError
+from blobstash.base.tracing import span
 
 from requests import HTTPError
 
@@ -19,7 +22,7 @@ class NodeNotFoundError(FileTreeError):
 def file_hash(path):
     """Return the Blake2b (32 bytes) hash of the file at path."""
     h = blake2b(digest_size=32)
-    with open(path, "rb") as f:
+    with span("blobstash.filetree.file_hash"), open(path, "rb") as f:
         while 1:
             buf = f.read(4096)
             if not buf:
@@ -111,12 +114,14 @@ class FS:
 
         return "/api/filetree/fs/ref/" + self.ref + p
 
-    def node(self, path="/"):
+    def node(self, path="/", deadline=None):
         """Return the node stored at path."""
         # TODO(tsileo): add the option to fetch the whole tree in one request, instead of just the childen by default
         try:
             return Node.from_resp(
-                self._client.request("GET", self._path(path), params=self.params)
+                self._client.request(
+                    "GET", self._path(path), params=self.params, deadline=deadline
+                )
             )
         except HTTPError as error:
             # FIXME(tsileo): remove 500
@@ -125,7 +130,7 @@ class FS:
             else:
                 raise
 
-    def fput_node(self, path, fileobj, content_type=None):
+    def fput_node(self, path, fileobj, content_type=None, deadline=None):
         """Creates a new node at path (file only) with the content of fileobj."""
         return Node.from_resp(
             self._client.request(
@@ -133,16 +138,18 @@ class FS:
                 self._path(path),
                 files=[("file", (Path(path).name, fileobj, content_type))],
                 params=self.params,
+                deadline=deadline,
             )
         )
 
-    def put_node(self, path, src_path):
+    def put_node(self, path, src_path, deadline=None):
         """Creates a new node at path (file only) with the content of the locally stored at src_path."""
         if Path(src_path).is_dir():
             raise FileTreeError("can only put file in a FS")
 
+        deadline = as_deadline(deadline)
         try:
-            current_node = self.node(path)
+            current_node = self.node(path, deadline=deadline)
             content_hash = current_node.metadata["blake2b-hash"]
             local_hash = file_hash(src_path)
             if local_hash == content_hash:
@@ -153,41 +160,54 @@ class FS:
 
         src = Path(src_path)
         with open(src, "rb") as f:
-            return self.fput_node(path, f)
+            return self.fput_node(path, f, deadline=deadline)
 
-    def download(self, dst_path):
-        """Download the file system to locally at dst_path."""
-        os.makedirs(dst_path)
-        root = self.node()
-        self._download(root, "/", dst_path)
+    def download(self, dst_path, deadline=None):
+        """Download the file system to locally at dst_path.
 
-    def _download(self, root, root_path, dst_path):
+        `deadline` (a `blobstash.base.deadline.Deadline` or a number of seconds) bounds the whole download,
+        `DeadlineExceededError` is raised once it's exceeded.
+
+        """
+        deadline = as_deadline(deadline)
+        with span("blobstash.filetree.download", {"fs.name": self.name}):
+            os.makedirs(dst_path)
+            root = self.node(deadline=deadline)
+            self._download(root, "/", dst_path, deadline)
+
+    def _download(self, root, root_path, dst_path, deadline=None):
         for child in root.children:
             p = os.path.join(root_path, child.name)
             dst = os.path.join(dst_path, p[1:])
             if child.is_dir():
-                new_root = self.node(p)
+                new_root = self.node(p, deadline=deadline)
                 os.makedirs(dst)
-                self._download(new_root, p, dst_path)
+                self._download(new_root, p, dst_path, deadline)
             else:
                 # download
-                self.client.get_node(child, dst)
+                self.client.get_node(child, dst, deadline=deadline)
 
-    def upload(self, src_path):
-        """Creates a new remote filesystem name from the local directory path."""
+    def upload(self, src_path, deadline=None):
+        """Creates a new remote filesystem name from the local directory path.
+
+        `deadline` (a `blobstash.base.deadline.Deadline` or a number of seconds) bounds the whole upload,
+        `DeadlineExceededError` is raised once it's exceeded.
+
+        """
         p = Path(src_path)
         if p.is_file():
             raise FileTreeError("path must be a dir, not a file")
 
-        self._fs_from_dir_iter(p, base_root=p)
+        with span("blobstash.filetree.upload", {"fs.name": self.name}):
+            self._fs_from_dir_iter(p, base_root=p, deadline=as_deadline(deadline))
 
-    def _fs_from_dir_iter(self, root, base_root):
+    def _fs_from_dir_iter(self, root, base_root, deadline=None):
         for p in root.iterdir():
             if p.is_file():
                 node_path = "/" + str(p.relative_to(base_root))
                 # FIXME(tsileo): check the current node (blake2b hash), but handle 404 on node before
                 try:
-                    current_node = self.node(node_path)
+                    current_node = self.node(node_path, deadline=deadline)
                     content_hash = current_node.metadata["blake2b-hash"]
                     local_hash = file_hash(p.absolute())
                     if local_hash == content_hash:
@@ -195,38 +215,41 @@ class FS:
 
                 except NodeNotFoundError:
                     pass
-                self.put_node(node_path, p.absolute())
+                self.put_node(node_path, p.absolute(), deadline=deadline)
             elif p.is_dir():
-                self._fs_from_dir_iter(p, base_root=base_root)
+                self._fs_from_dir_iter(p, base_root=base_root, deadline=deadline)
 
 
 class FileTreeClient:
     """BlobStash FileTree client."""
 
-    def __init__(self, base_url=None, api_key=None, client=None):
+    def __init__(
+        self, base_url=None, api_key=None, client=None, timeout=DEFAULT_TIMEOUT
+    ):
         if client:
             self._client = client
             return
 
-        self._client = Client(base_url=base_url, api_key=api_key)
+        self._client = Client(base_url=base_url, api_key=api_key, timeout=timeout)
 
-    def fput_node(self, name, fileobj, content_type=None):
+    def fput_node(self, name, fileobj, content_type=None, deadline=None):
         """Upload the fileobj as name, and return the newly created node."""
         return Node.from_resp(
             self._client.request(
                 "POST",
                 "/api/filetree/upload",
                 files=[("file", (name, fileobj, content_type))],
+                deadline=deadline,
             )
         )
 
-    def put_node(self, path):
+    def put_node(self, path, deadline=None):
         """Uppload the file at the given path, and return the newly created node."""
         name = Path(path).name
         with open(path, "rb") as f:
-            return self.fput_node(name, f)
+            return self.fput_node(name, f, deadline=deadline)
 
-    def fget_node(self, ref_or_node):
+    def fget_node(self, ref_or_node, deadline=None):
         """Returns a file-like object for given node ref.
 
         It's up to the client to call `close` to release the connection.
@@ -237,15 +260,22 @@ class FileTreeClient:
         else:
             ref = ref_or_node
         return self._client.request(
-            "GET", "/api/filetree/file/" + ref, raw=True, stream=True
+            "GET",
+            "/api/filetree/file/" + ref,
+            raw=True,
+            stream=True,
+            deadline=deadline,
         ).raw
 
-    def get_node(self, ref_or_node, path):
+    def get_node(self, ref_or_node, path, deadline=None):
         """Download the content of the given node at path."""
+        deadline = as_deadline(deadline)
         with open(path, "wb") as f:
-            reader = self.fget_node(ref_or_node)
+            reader = self.fget_node(ref_or_node, deadline=deadline)
             try:
                 while 1:
+                    if deadline is not None:
+                        deadline.check()
                     chunk = reader.read(1024)
                     if not chunk:
                         break
@@ -0,0 +1,215 @@
+"""asyncio FileTree client, requires `aiohttp` (`pip install blobstash[async]`)."""
+import os
+from pathlib import Path
+
+import aiohttp
+
+from blobstash.base.aio import AsyncClient
+from blobstash.filetree import FileTreeError
+from blobstash.filetree import Node
+from blobstash.filetree import NodeNotFoundError
+from blobstash.filetree import file_hash
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _form(name, fileobj, content_type=None):
+    # `fileobj` can be a file-like object, bytes or an async iterable yielding bytes (streamed as a chunked upload)
+    data = aiohttp.FormData()
+    data.add_field("file", fileobj, filename=name, content_type=content_type)
+    return data
+
+
+class AsyncNodeReader:
+    """File-like object for reading a node content as it's streamed from BlobStash.
+
+    It's up to the client to call `close` (or to use it as an async context manager) to release the connection.
+
+    """
+
+    def __init__(self, resp):
+        self._resp = resp
+
+    async def read(self, n=-1):
+        return await self._resp.content.read(n)
+
+    def close(self):
+        self._resp.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __aiter__(self):
+        return self._resp.content.iter_chunked(CHUNK_SIZE)
+
+
+class AsyncFS:
+    """FS represents a file system (a tree of `Node`)."""
+
+    def __init__(self, client, name=None, ref=None, prefix=None):
+        self._client = client._client
+        self.client = client
+        self.name = name
+        self.ref = ref
+        self.prefix = prefix
+        params = {}
+        if self.prefix:
+            params["prefix"] = self.prefix
+        self.params = params
+
+    def __repr__(self):
+        return "blobstash.filetree.aio.AsyncFS(name={!r})".format(self.name)
+
+    def _path(self, p):
+        if self.name:
+            return "/api/filetree/fs/fs/" + self.name + p
+
+        return "/api/filetree/fs/ref/" + self.ref + p
+
+    async def node(self, path="/"):
+        """Return the node stored at path."""
+        try:
+            return Node.from_resp(
+                await self._client.request("GET", self._path(path), params=self.params)
+            )
+        except aiohttp.ClientResponseError as error:
+            # FIXME(tsileo): remove 500
+            if error.status in [404, 500]:
+                raise NodeNotFoundError
+            else:
+                raise
+
+    async def fput_node(self, path, fileobj, content_type=None):
+        """Creates a new node at path (file only) with the content of fileobj."""
+        return Node.from_resp(
+            await self._client.request(
+                "POST",
+                self._path(path),
+                data=_form(Path(path).name, fileobj, content_type),
+                params=self.params,
+            )
+        )
+
+    async def put_node(self, path, src_path):
+        """Creates a new node at path (file only) with the content of the locally stored at src_path."""
+        if Path(src_path).is_dir():
+            raise FileTreeError("can only put file in a FS")
+
+        try:
+            current_node = await self.node(path)
+            content_hash = current_node.metadata["blake2b-hash"]
+            local_hash = file_hash(src_path)
+            if local_hash == content_hash:
+                return current_node
+
+        except NodeNotFoundError:
+            pass
+
+        src = Path(src_path)
+        with open(src, "rb") as f:
+            return await self.fput_node(path, f)
+
+    async def download(self, dst_path):
+        """Download the file system to locally at dst_path."""
+        os.makedirs(dst_path)
+        root = await self.node()
+        await self._download(root, "/", dst_path)
+
+    async def _download(self, root, root_path, dst_path):
+        for child in root.children:
+            p = os.path.join(root_path, child.name)
+            dst = os.path.join(dst_path, p[1:])
+            if child.is_dir():
+                new_root = await self.node(p)
+                os.makedirs(dst)
+                await self._download(new_root, p, dst_path)
+            else:
+                await self.client.get_node(child, dst)
+
+    async def upload(self, src_path):
+        """Creates a new remote filesystem name from the local directory path."""
+        p = Path(src_path)
+        if p.is_file():
+            raise FileTreeError("path must be a dir, not a file")
+
+        await self._fs_from_dir_iter(p, base_root=p)
+
+    async def _fs_from_dir_iter(self, root, base_root):
+        for p in root.iterdir():
+            if p.is_file():
+                node_path = "/" + str(p.relative_to(base_root))
+                await self.put_node(node_path, p.absolute())
+            elif p.is_dir():
+                await self._fs_from_dir_iter(p, base_root=base_root)
+
+
+class AsyncFileTreeClient:
+    """BlobStash FileTree asyncio client."""
+
+    def __init__(self, base_url=None, api_key=None, client=None):
+        if client:
+            self._client = client
+            return
+
+        self._client = AsyncClient(base_url=base_url, api_key=api_key)
+
+    async def close(self):
+        await self._client.close()
+
+    async def fput_node(self, name, fileobj, content_type=None):
+        """Upload the fileobj (or async iterable of bytes) as name, and return the newly created node."""
+        return Node.from_resp(
+            await self._client.request(
+                "POST", "/api/filetree/upload", data=_form(name, fileobj, content_type)
+            )
+        )
+
+    async def put_node(self, path):
+        """Uppload the file at the given path, and return the newly created node."""
+        name = Path(path).name
+        with open(path, "rb") as f:
+            return await self.fput_node(name, f)
+
+    async def fget_node(self, ref_or_node):
+        """Returns an `AsyncNodeReader` for given node ref."""
+        if isinstance(ref_or_node, Node):
+            ref = ref_or_node.ref
+        else:
+            ref = ref_or_node
+        resp = await self._client.request(
+            "GET", "/api/filetree/file/" + ref, raw=True, stream=True
+        )
+        try:
+            resp.raise_for_status()
+        except aiohttp.ClientResponseError:
+            resp.release()
+            raise
+        return AsyncNodeReader(resp)
+
+    async def get_node(self, ref_or_node, path):
+        """Download the content of the given node at path."""
+        async with await self.fget_node(ref_or_node) as reader:
+            with open(path, "wb") as f:
+                async for chunk in reader:
+                    f.write(chunk)
+
+    async def node(self, ref):
+        """Returns the node for the given ref."""
+        return Node.from_resp(
+            (await self._client.request("GET", "/api/filetree/node/" + ref))["node"]
+        )
+
+    def fs(self, name=None, ref=None, prefix=None):
+        """Returns the filesystem for the given name if it exists."""
+        return AsyncFS(self, name=name, ref=ref, prefix=prefix)
+
+    def __repr__(self):
+        return "blobstash.filetree.aio.AsyncFileTreeClient(base_url={!r})".format(
+            self._client.base_url
+        )
+
+    def __str__(self):
+        return self.__repr__()
@@ -15,6 +15,7 @@ setup(
     license="MIT",
     zip_safe=False,
     install_requires=["requests", "jsonpatch"],
+    extras_require={"async": ["aiohttp"], "orjson": ["orjson"]},
     python_requires=">=3.6",
     classifiers=[
         "Development Status :: 3 - Alpha",
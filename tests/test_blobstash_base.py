@@ -1,11 +1,68 @@
+import asyncio
+import base64
+import gc
+import gzip
+import io
+import json
+import mmap
 import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
 
 import pytest
+import requests
 
 from blobstash.base.blobstore import Blob, BlobNotFoundError, BlobStoreClient
+from blobstash.base.blobstore import BlobHashMismatchError
+from blobstash.base.blobstore import BlobRef
+from blobstash.base.blobstore import BlobsIterator
+from blobstash.base.blobstore import MissingBlobsError
+from blobstash.base.bloom import BloomFilter
+from blobstash.base.cache import BlobCache
+from blobstash.base.cache import DiskCache
+from blobstash.base.cache import MemoryCache
+from blobstash.base.checkpoint import Checkpoint
+from blobstash.base.chunker import FastCDC
+from blobstash.base.chunker import Manifest
+from blobstash.base.client import DEFAULT_TIMEOUT
 from blobstash.base.client import Client
+from blobstash.base.client import get_session
+from blobstash.base.client import set_limiter
+from blobstash.base.deadline import Deadline
+from blobstash.base.error import DeadlineExceededError
+from blobstash.base.inventory import BlobInventory
+from blobstash.base.iterator import AdaptivePageSize
+from blobstash.base.jsonstream import JSONStream
 from blobstash.base.kvstore import KVStoreClient
+from blobstash.base.kvstore import KeysIterator
+from blobstash.base.limiter import Budget
+from blobstash.base.limiter import Limiter
+from blobstash.base.metrics import Metrics
+from blobstash.base.retry import HedgePolicy
+from blobstash.base.retry import RetryPolicy
+from blobstash.base.singleflight import SingleFlight
+from blobstash.base.test_utils import BENCH
 from blobstash.base.test_utils import BlobStash
+from blobstash.base.test_utils import BENCH_ITEMS
+from blobstash.base.test_utils import BENCH_PER_PAGE
+from blobstash.base.test_utils import FakePaginatedClient
+from blobstash.base.test_utils import bench_chunker
+from blobstash.base.test_utils import bench_scan
+from blobstash.base.test_utils import StubServer
+from blobstash.base.tracing import RecordingTracer
+from blobstash.base.tracing import set_tracer
+from blobstash.base.tracing import span
+from blobstash.base.tracing import start_profiler
+from blobstash.base.tracing import stop_profiler
+from blobstash.base.verify import HashVerifier
+
+benchmark = pytest.mark.skipif(not BENCH, reason="set BLOBSTASH_BENCH=1 to run")
 
 
 def test_test_utils():
@@ -22,6 +79,1124 @@ def test_test_utils():
         b.cleanup()
 
 
+def test_client_shared_session():
+    """Ensure clients for the same BlobStash instance share their connections pool."""
+    c1 = Client(base_url="http://blobstash-pool-test:8050")
+    c2 = Client(base_url="http://blobstash-pool-test:8050")
+    c3 = Client(base_url="http://blobstash-pool-test2:8050")
+    assert c1.session is c2.session
+    assert c1.session is not c3.session
+    assert get_session("http://blobstash-pool-test:8050") is c1.session
+
+    blobstore = BlobStoreClient(base_url="http://blobstash-pool-test:8050")
+    kvstore = KVStoreClient(base_url="http://blobstash-pool-test:8050")
+    assert blobstore._client.session is kvstore._client.session is c1.session
+
+
+def _kv_stub(method, path, body):
+    if path == "/api/kvstore/key/k":
+        data = {"key": "k", "version": 1, "data": base64.b64encode(b"v").decode()}
+        return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+    return 404, {}, b""
+
+
+def test_unix_socket_transport():
+    """Ensure the Unix socket transport works and reuses its connections, like TCP."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        sock = os.path.join(tmpdir, "blobstash.sock")
+        with StubServer(_kv_stub) as tcp, StubServer(_kv_stub, sock) as unix:
+            assert unix.base_url == "unix://" + sock
+
+            for server in [tcp, unix]:
+                client = KVStoreClient(base_url=server.base_url)
+                for _ in range(50):
+                    assert client.get("k").data == b"v"
+                assert server.connections == 1
+    finally:
+        os.rmdir(tmpdir)
+
+
+def test_client_metrics():
+    metrics = Metrics()
+    with StubServer(_kv_stub) as server:
+        client = Client(base_url=server.base_url, metrics=metrics)
+        kvstore = KVStoreClient(client=client)
+        blobstore = BlobStoreClient(client=client)
+        for _ in range(10):
+            kvstore.get("k")
+        with pytest.raises(BlobNotFoundError):
+            blobstore.get("0" * 64)
+
+    stats = metrics.get("GET", "/api/kvstore/key/{key}")
+    assert stats["count"] == 10
+    assert stats["status_codes"] == {200: 10}
+    assert stats["response_bytes"] > 0
+    assert 0 < stats["p50"] <= stats["p95"] <= stats["p99"]
+
+    stats = metrics.get("GET", "/api/blobstore/blob/{hash}")
+    assert stats["status_codes"] == {404: 1}
+
+    text = metrics.to_prometheus()
+    assert (
+        'blobstash_client_requests_total{method="GET",endpoint="/api/kvstore/key/{key}",status="200"} 10'
+        in text
+    )
+    assert (
+        'blobstash_client_request_duration_seconds_count{method="GET",endpoint="/api/kvstore/key/{key}"} 10'
+        in text
+    )
+
+
+def test_client_retry():
+    calls = []
+
+    def flaky(method, path, body):
+        calls.append(path)
+        if len(calls) < 3:
+            return 503, {}, b""
+        return _kv_stub(method, path, body)
+
+    with StubServer(flaky) as server:
+        client = Client(base_url=server.base_url, retry=RetryPolicy(backoff=0.01))
+        assert KVStoreClient(client=client).get("k").data == b"v"
+        assert len(calls) == 3
+
+        # Non-idempotent requests are not retried
+        calls.clear()
+        with pytest.raises(Exception):
+            client.request("POST", "/api/kvstore/key/k")
+        assert len(calls) == 1
+
+
+def test_client_hedged_blob_get():
+    blob = Blob.from_data(b"hello")
+    calls = []
+
+    def slow_first(method, path, body):
+        calls.append(path)
+        if len(calls) == 1:
+            time.sleep(1)
+        return 200, {}, blob.data
+
+    hedge = HedgePolicy(delay=0.05)
+    with StubServer(slow_first) as server:
+        client = BlobStoreClient(client=Client(base_url=server.base_url, hedge=hedge))
+        start = time.perf_counter()
+        assert client.get(blob.hash) == blob
+        assert time.perf_counter() - start < 0.5
+        assert hedge.hedged == 1
+        assert hedge.hedge_wins == 1
+
+
+# Modules that must only be imported on first use
+_LAZY_IMPORTS = ["jsonpatch", "jsonpointer", "aiohttp", "asyncio", "concurrent.futures"]
+
+
+def _import_times(module):
+    """Returns the `python -X importtime` self/cumulative times (in us) for each module imported by `import module`."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = {}
+    for line in out.splitlines():
+        parts = line.split("|")
+        try:
+            self_us = int(parts[0].split(":")[1])
+        except ValueError:
+            continue
+        times[parts[2].strip()] = (self_us, int(parts[1]))
+
+    return times
+
+
+@pytest.mark.parametrize(
+    "module", ["blobstash.base.kvstore", "blobstash.docstore", "blobstash.filetree"]
+)
+def test_import_time(module):
+    """Guard against import time regressions (the heavy optional modules must be imported lazily)."""
+    times = _import_times(module)
+    assert module in times
+    for lazy_module in _LAZY_IMPORTS:
+        assert lazy_module not in times, "{} imported eagerly".format(lazy_module)
+
+
+def test_client_limiter():
+    lock = threading.Lock()
+    in_flight = {"GET": 0, "POST": 0}
+    max_in_flight = {"GET": 0, "POST": 0}
+
+    def slow(method, path, body):
+        with lock:
+            in_flight[method] += 1
+            max_in_flight[method] = max(max_in_flight[method], in_flight[method])
+        time.sleep(0.05)
+        with lock:
+            in_flight[method] -= 1
+        return _kv_stub("GET", "/api/kvstore/key/k", body)
+
+    with StubServer(slow) as server:
+        limiter = Limiter(
+            reads=Budget(requests_per_second=40, burst_requests=1),
+            writes=Budget(max_in_flight=1),
+        )
+        Client(base_url=server.base_url, limiter=limiter)
+        try:
+            # The limiter is shared by all the clients for this base_url
+            kvstore = KVStoreClient(base_url=server.base_url)
+            start = time.perf_counter()
+            threads = [
+                threading.Thread(target=kvstore.put, args=("k", "v")) for _ in range(4)
+            ] + [threading.Thread(target=kvstore.get, args=("k",)) for _ in range(5)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            assert max_in_flight["POST"] == 1
+            assert max_in_flight["GET"] > 1
+            # 5 reads at 40 req/s, with a burst of 1
+            assert time.perf_counter() - start >= 0.1
+        finally:
+            set_limiter(server.base_url, None)
+
+
+def test_client_single_flight():
+    blob = Blob.from_data(b"hello")
+    calls = []
+
+    def slow(method, path, body):
+        calls.append(path)
+        time.sleep(0.2)
+        return 200, {}, blob.data
+
+    single_flight = SingleFlight()
+    with StubServer(slow) as server:
+        client = BlobStoreClient(
+            client=Client(base_url=server.base_url, single_flight=single_flight)
+        )
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(client.get(blob.hash)))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+
+        # Requests with different credentials are not collapsed
+        calls.clear()
+        clients = [
+            BlobStoreClient(
+                client=Client(
+                    base_url=server.base_url,
+                    api_key=api_key,
+                    single_flight=single_flight,
+                )
+            )
+            for api_key in ["key1", "key2"]
+        ]
+        threads = [
+            threading.Thread(target=lambda c=c: c.get(blob.hash)) for c in clients
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 2
+
+    assert results == [blob] * 8
+    assert single_flight.stats() == {"calls": 3, "collapsed": 7}
+
+
+def test_client_routing():
+    calls = {"primary": [], "replica": []}
+
+    def node(name, latency):
+        def handler(method, path, body):
+            calls[name].append(method)
+            time.sleep(latency)
+            return _kv_stub(method, path, body)
+
+        return handler
+
+    # A stopped server to simulate a dead node
+    with StubServer(_kv_stub) as dead:
+        pass
+
+    with StubServer(node("primary", 0.02)) as primary, StubServer(
+        node("replica", 0)
+    ) as replica:
+        client = Client(
+            base_url=[primary.base_url, replica.base_url, dead.base_url],
+            routing=dict(max_failures=1),
+        )
+        kv = KVStoreClient(client=client)
+        for _ in range(20):
+            assert kv.get("k").data == b"v"
+
+        # Reads fail over the dead node, which gets ejected, and favor the fastest replica
+        dead_endpoint = client.endpoints.endpoints[2]
+        assert dead_endpoint.failures >= 1
+        assert not dead_endpoint.is_healthy(time.monotonic())
+        assert len(calls["replica"]) > len(calls["primary"])
+
+        # Writes are pinned to the primary
+        calls["primary"].clear()
+        calls["replica"].clear()
+        client.request("POST", "/api/kvstore/key/k", raw=True)
+        assert calls == {"primary": ["POST"], "replica": []}
+
+
+def test_client_deadline():
+    def slow_pages(method, path, body):
+        time.sleep(0.05)
+        if path.startswith("/api/kvstore/keys"):
+            data = {
+                "data": [{"key": "k", "version": 1}],
+                "pagination": {"has_more": True, "cursor": "next", "count": 1},
+            }
+            return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+        return 503, {}, b""
+
+    with StubServer(slow_pages) as server:
+        # Per-request timeout
+        client = Client(base_url=server.base_url, timeout=0.01)
+        with pytest.raises(Exception) as excinfo:
+            client.request("GET", "/api/kvstore/keys")
+        assert not isinstance(excinfo.value, DeadlineExceededError)
+
+        # Finite by default, and configurable from the sub-clients
+        assert Client(base_url=server.base_url).timeout == DEFAULT_TIMEOUT
+        kv = KVStoreClient(base_url=server.base_url, timeout=0.01)
+        with pytest.raises(requests.exceptions.Timeout):
+            kv.get("k")
+
+        # The deadline is shared by all the pages of the iteration
+        kv = KVStoreClient(client=Client(base_url=server.base_url))
+        keys = []
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            for key in kv.iter(deadline=0.18):
+                keys.append(key)
+        assert 2 <= len(keys) <= 4
+        assert time.monotonic() - start < 0.3
+
+        # Retries stop once the deadline is exceeded
+        client = Client(base_url=server.base_url, retry=RetryPolicy(max_attempts=100))
+        deadline = Deadline(0.2)
+        with pytest.raises(DeadlineExceededError):
+            client.request("GET", "/api/kvstore/key/k", deadline=deadline)
+        assert deadline.expired()
+
+
+def test_tracing():
+    # No-op when there's no tracer
+    assert span("noop") is span("other")
+
+    tracer = RecordingTracer()
+    set_tracer(tracer)
+    try:
+        with StubServer(_kv_stub) as server:
+            kv = KVStoreClient(client=Client(base_url=server.base_url))
+            with span("app.op"):
+                assert kv.get("k").data == b"v"
+    finally:
+        set_tracer(None)
+
+    (root,) = tracer.spans
+    assert root.name == "app.op"
+    (request,) = root.children
+    assert request.name == "blobstash.request"
+    assert request.attributes["http.status_code"] == 200
+    assert [child.name for child in request.children] == [
+        "blobstash.http",
+        "blobstash.json.decode",
+    ]
+    assert tracer.summary()["blobstash.request"]["count"] == 1
+
+
+def test_sampling_profiler():
+    def slow(method, path, body):
+        time.sleep(0.05)
+        return _kv_stub(method, path, body)
+
+    profiler = start_profiler(interval=0.001)
+    try:
+        with StubServer(slow) as server:
+            KVStoreClient(client=Client(base_url=server.base_url)).get("k")
+    finally:
+        assert stop_profiler() is profiler
+
+    assert span("noop") is span("other")
+    assert profiler.samples
+    assert {name for name, _ in profiler.samples} <= {
+        "blobstash.request",
+        "blobstash.http",
+        "blobstash.json.decode",
+    }
+    out = io.StringIO()
+    profiler.dump(out)
+    assert "blobstash.http" in out.getvalue()
+
+
+def test_iterator_stream():
+    pages = {}
+    for i, cursor in enumerate(["", "2"]):
+        blobs = [
+            {"hash": "{:064x}".format(i * 5000 + j), "size": j} for j in range(5000)
+        ]
+        resp = {
+            "data": blobs,
+            "pagination": {"has_more": i == 0, "cursor": "2", "count": len(blobs)},
+        }
+        pages[cursor] = json.dumps(resp).encode()
+
+    def handler(method, path, body):
+        cursor = "2" if "cursor=2" in path else ""
+        return 200, {"Content-Type": "application/json"}, pages[cursor]
+
+    with StubServer(handler) as server:
+        blobstore = BlobStoreClient(base_url=server.base_url)
+        expected = [blob.hash for blob in blobstore.iter()]
+        assert len(expected) == 10000
+        assert [blob.hash for blob in blobstore.iter(stream=True)] == expected
+        assert len(list(blobstore.iter(stream=True, limit=10))) == 10
+        streamed_pages = list(blobstore.iter(stream=True).iter_pages())
+        assert [blob.hash for page in streamed_pages for blob in page] == expected
+
+        # Streaming only keeps a single item in memory, instead of the whole page
+        def peak(stream):
+            tracemalloc.start()
+            for blob in blobstore.iter(stream=stream):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+
+        assert peak(True) < peak(False) / 2
+
+
+def test_json_stream_chunk_boundaries():
+    body = (
+        '{"n":-0.25,"data":[1.5,2e3,-0.5,10,"é",true,null,{"x":[1E-2]}],"m":7}'.encode()
+    )
+    expected = json.loads(body)
+    for i in range(len(body) + 1):
+        stream = JSONStream([body[:i], body[i:]])
+        assert list(stream) == expected["data"]
+        assert stream.resp == {"n": -0.25, "m": 7}
+    assert list(JSONStream(bytes([c]) for c in body)) == expected["data"]
+
+
+@pytest.mark.parametrize(
+    "iterator_class,items",
+    [
+        (
+            BlobsIterator,
+            [{"hash": "{:064x}".format(i), "size": i} for i in range(1000)],
+        ),
+        (KeysIterator, [{"key": "k{}".format(i), "version": 1} for i in range(1000)]),
+    ],
+)
+@benchmark
+def test_iterator_prefetch_benchmark(iterator_class, items):
+    results = bench_scan(
+        lambda client, prefetch: iterator_class(
+            client, per_page=BENCH_PER_PAGE, prefetch=prefetch
+        ),
+        items,
+    )
+    print(
+        "{} x{}: {:.0f} items/s, {:.0f} items/s with prefetch".format(
+            iterator_class.__name__, BENCH_ITEMS, results[0], results[2]
+        )
+    )
+    # Fetching the next page while the current one is consumed hides the latency
+    assert results[2] > results[0] * 1.2
+
+
+def test_iterator_prefetch():
+    items = [{"key": "k{}".format(i), "version": i} for i in range(10)]
+    client = FakePaginatedClient(items, 95)
+    keys = list(KeysIterator(client, per_page=10, prefetch=3))
+    assert [key.version for key in keys] == [i % 10 for i in range(95)]
+    assert client.requests == 10
+
+    # The next pages are fetched before the first one is consumed (at most `prefetch` pages ahead)
+    client = FakePaginatedClient(items, 95)
+    with KeysIterator(client, per_page=10, prefetch=2) as iterator:
+        assert next(iterator).version == 0
+        for _ in range(200):
+            if client.requests >= 4:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        assert client.requests == 4
+    client = FakePaginatedClient(items, 95)
+    iterator = KeysIterator(client, per_page=10)
+    assert next(iterator).version == 0
+    assert client.requests == 1
+
+    # The prefetching stops with the limit
+    client = FakePaginatedClient(items, 1000)
+    with KeysIterator(client, per_page=10, prefetch=2, limit=25) as iterator:
+        assert len(list(iterator)) == 25
+        assert iterator.cursor == "25"
+    time.sleep(0.2)
+    assert client.requests <= 5
+
+    # An abandoned iterator is collected and stops its thread
+    def prefetching():
+        return [t for t in threading.enumerate() if t.name == "blobstash-prefetch"]
+
+    client = FakePaginatedClient(items, 1000)
+    for key in KeysIterator(client, per_page=10, prefetch=2):
+        break
+    time.sleep(0.2)
+    gc.collect()
+    time.sleep(0.2)
+    assert not prefetching()
+    assert client.requests <= 4
+
+
+def test_iterator_pages_and_batches():
+    items = [{"key": "k{}".format(i), "version": i} for i in range(10)]
+
+    iterator = KeysIterator(FakePaginatedClient(items, 95), per_page=10)
+    cursors = []
+    sizes = []
+    for page in iterator.iter_pages():
+        sizes.append(len(page))
+        cursors.append(iterator.cursor)
+    assert sizes == [10] * 9 + [5]
+    assert cursors == [str(10 * i) for i in range(1, 10)] + ["95"]
+
+    # Respects the limit, and the items already buffered
+    iterator = KeysIterator(FakePaginatedClient(items, 95), per_page=10, limit=25)
+    assert next(iterator).version == 0
+    assert [len(page) for page in iterator.iter_pages()] == [9, 10, 5]
+
+    for prefetch in [0, 2]:
+        iterator = KeysIterator(
+            FakePaginatedClient(items, 95), per_page=10, prefetch=prefetch
+        )
+        batches = list(iterator.iter_batches(25))
+        assert [len(batch) for batch in batches] == [25, 25, 25, 20]
+        assert [key.version for batch in batches for key in batch] == [
+            i % 10 for i in range(95)
+        ]
+
+    iterator = KeysIterator(FakePaginatedClient(items, 23), per_page=10)
+    assert [len(batch) for batch in iterator.iter_batches(4)] == [4] * 5 + [3]
+
+
+def test_iterator_checkpoint(tmp_path):
+    items = [{"key": "k{}".format(i), "version": i} for i in range(95)]
+    path = tmp_path / "scan.checkpoint"
+
+    # Crash in the middle of the 4th page
+    versions = []
+    for key in KeysIterator(
+        FakePaginatedClient(items, 95), per_page=10, checkpoint=path
+    ):
+        if len(versions) == 37:
+            break
+        versions.append(key.version)
+    assert Checkpoint(path).load() == {
+        "path": "/api/kvstore/keys",
+        "params": {},
+        "cursor": "30",
+        "returned": 30,
+        "done": False,
+    }
+
+    # Resume from the start of the 4th page (items 30 to 36 are returned again)
+    for prefetch in [0, 2]:
+        iterator = KeysIterator(
+            FakePaginatedClient(items, 95),
+            per_page=10,
+            prefetch=prefetch,
+            resume_from=path,
+        )
+        assert [key.version for key in iterator] == list(range(30, 95))
+
+    iterator = KeysIterator(
+        FakePaginatedClient(items, 95), per_page=10, checkpoint=path, resume_from=path
+    )
+    assert len(list(iterator.iter_pages())) == 7
+    assert Checkpoint(path).load()["done"]
+    assert list(KeysIterator(FakePaginatedClient(items, 95), resume_from=path)) == []
+
+    with pytest.raises(ValueError):
+        BlobsIterator(FakePaginatedClient(items, 95), resume_from=path)
+
+
+def test_async_iterator_checkpoint(tmp_path):
+    pytest.importorskip("aiohttp")
+    from blobstash.base.aio import AsyncKeysIterator
+
+    class AsyncClient:
+        def __init__(self, client):
+            self.client = client
+
+        async def request(self, verb, path, params=None, **kwargs):
+            return self.client.request(verb, path, params=params, **kwargs)
+
+    async def keys(**kwargs):
+        client = AsyncClient(FakePaginatedClient(items, 95))
+        return [key.version async for key in AsyncKeysIterator(client, **kwargs)]
+
+    items = [{"key": "k{}".format(i), "version": i} for i in range(95)]
+    path = tmp_path / "scan.checkpoint"
+    assert asyncio.run(keys(per_page=10, checkpoint=path)) == list(range(95))
+    assert Checkpoint(path).load()["done"]
+
+    # Resume in the middle of the scan
+    Checkpoint(path).save(
+        path="/api/kvstore/keys", cursor="50", returned=50, done=False
+    )
+    assert asyncio.run(keys(per_page=10, resume_from=path)) == list(range(50, 95))
+
+    for kwargs in [{"stream": True}, {"prefetch": 2}]:
+        with pytest.raises(ValueError):
+            AsyncKeysIterator(AsyncClient(None), **kwargs)
+
+
+def test_iterator_adaptive_page_size():
+    # The last page is sized to the remaining limit
+    client = FakePaginatedClient([{"hash": "a" * 64, "size": 1}], 1000)
+    assert len(list(BlobsIterator(client, per_page=10, limit=25))) == 25
+    assert client.limits == [10, 10, 5]
+    client = FakePaginatedClient([{"key": "k", "version": 1}], 1000)
+    assert len(list(KeysIterator(client, limit=3))) == 3
+    assert len(list(KeysIterator(client, limit=120))) == 120
+    assert client.limits == [3, 50, 50, 20]
+
+    page_size = AdaptivePageSize(target_seconds=None, target_bytes=1000, initial=8)
+    page_size.observe(8, size=100)
+    assert page_size.size == 16  # Grows by a factor 2 at most
+    page_size.observe(16, size=8000)
+    assert page_size.size == 10  # Shrinks to the min size
+
+    def handler(method, path, body):
+        limit = int(path.split("limit=")[1].split("&")[0])
+        blobs = [{"hash": "{:064x}".format(i), "size": 10000} for i in range(limit)]
+        # Big items (~10KB each)
+        for blob in blobs:
+            blob["data"] = "x" * 10000
+        resp = {
+            "data": blobs,
+            "pagination": {"has_more": True, "cursor": "next", "count": limit},
+        }
+        return 200, {"Content-Type": "application/json"}, json.dumps(resp).encode()
+
+    with StubServer(handler) as server:
+        page_size = AdaptivePageSize(target_bytes=100000, initial=50, min_size=1)
+        blobstore = BlobStoreClient(base_url=server.base_url)
+        assert len(list(blobstore.iter(per_page=page_size, limit=200))) == 200
+        assert 5 <= page_size.size <= 15
+
+
+def _parse_multipart(body):
+    """Returns the (name, data) of the parts of a `multipart/form-data` body."""
+    boundary = body.split(b"\r\n", 1)[0]
+    parts = []
+    for part in body.split(boundary)[1:-1]:
+        headers, data = part[2:-2].split(b"\r\n\r\n", 1)
+        name = headers.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+        parts.append((name, data))
+    return parts
+
+
+def test_blobstore_put_many():
+    uploads = []
+
+    def handler(method, path, body):
+        assert (method, path) == ("POST", "/api/blobstore/upload")
+        time.sleep(0.05)
+        uploads.append(_parse_multipart(body))
+        return 200, {}, b""
+
+    blobs = [Blob.from_data(os.urandom(100 * (i % 7 + 1))) for i in range(50)]
+    with StubServer(handler) as server:
+        blobstore = BlobStoreClient(base_url=server.base_url)
+
+        # Same body as `put` (a `files` dict)
+        blobstore.put(blobs[0])
+        assert uploads.pop() == [(blobs[0].hash, blobs[0].data)]
+
+        reported = []
+        stats = blobstore.put_many(
+            iter(blobs), max_count=8, max_bytes=2000, on_batch=reported.append
+        )
+        assert stats == reported
+        assert [part for upload in uploads for part in upload] == [
+            (blob.hash, blob.data) for blob in blobs
+        ]
+        for upload in uploads:
+            assert len(upload) <= 8
+            assert sum(len(data) for _, data in upload) <= 2000
+        assert sum(batch.count for batch in stats) == len(blobs)
+        assert all(batch.bytes_per_second > 0 for batch in stats)
+
+        # A blob bigger than `max_bytes` is sent alone
+        uploads.clear()
+        blobstore.put_many(blobs[:3], max_bytes=1)
+        assert [len(upload) for upload in uploads] == [1, 1, 1]
+
+        uploads.clear()
+        start = time.perf_counter()
+        stats = blobstore.put_many(blobs, max_count=5, concurrency=5)
+        assert time.perf_counter() - start < 10 * 0.05 / 2
+        assert len(stats) == 10
+        assert sorted(part for upload in uploads for part in upload) == sorted(
+            (blob.hash, blob.data) for blob in blobs
+        )
+
+
+def test_bloom_filter(tmp_path):
+    hashes = [Blob.from_data(str(i).encode()).hash for i in range(2000)]
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    bloom.update(hashes[:1000])
+    assert all(hash in bloom for hash in hashes[:1000])
+    false_positives = sum(hash in bloom for hash in hashes[1000:])
+    assert false_positives < 30
+
+    path = tmp_path / "known.bloom"
+    bloom.save(path)
+    loaded = BloomFilter.load(path)
+    assert all(hash in loaded for hash in hashes[:1000])
+    assert len(loaded) == len(bloom)
+
+    other = BloomFilter(capacity=1000, error_rate=0.01)
+    other.add("extra")
+    loaded.merge(other)
+    assert "extra" in loaded
+    with pytest.raises(ValueError):
+        loaded.merge(BloomFilter(capacity=10))
+
+
+def test_blobstore_has_many():
+    blobs = [Blob.from_data(str(i).encode()) for i in range(10)]
+    stored = {blob.hash for blob in blobs[:5]}
+    requests = []
+
+    def handler(method, path, body):
+        requests.append((method, path))
+        if method == "HEAD":
+            return (200 if path.rsplit("/", 1)[1] in stored else 404), {}, b""
+        if method == "GET":
+            data = {
+                "data": [{"hash": hash, "size": 1} for hash in sorted(stored)],
+                "pagination": {"has_more": False, "cursor": "", "count": len(stored)},
+            }
+            return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+        for hash, _ in _parse_multipart(body):
+            stored.add(hash)
+        return 200, {}, b""
+
+    with StubServer(handler) as server:
+        blobstore = BlobStoreClient(base_url=server.base_url, known=set())
+        hashes = [blob.hash for blob in blobs]
+        assert blobstore.has_many(hashes) == set(hashes[:5])
+        assert blobstore.known == set(hashes[:5])
+
+        # The server is always asked by default
+        requests.clear()
+        assert blobstore.has_many(hashes) == set(hashes[:5])
+        assert len(requests) == 10
+
+        # The known hashes are not checked again
+        requests.clear()
+        assert blobstore.has_many(hashes, skip_known=True) == set(hashes[:5])
+        assert len(requests) == 5
+
+        # Uploads of known blobs are skipped
+        requests.clear()
+        blobstore.put(blobs[0], skip_known=True)
+        blobstore.put_many(blobs, skip_known=True)
+        assert [method for method, _ in requests] == ["POST"]
+        assert blobstore.known == set(hashes)
+
+        bloom = BloomFilter(capacity=100)
+        blobstore = BlobStoreClient(base_url=server.base_url, known=bloom)
+        assert blobstore.seed_known() == 10
+        assert all(hash in bloom for hash in hashes)
+
+
+def test_blobstore_cache(tmp_path):
+    blobs = {}
+    for i in range(20):
+        blob = Blob.from_data(os.urandom(1000 + i))
+        blobs[blob.hash] = blob
+    fetched = []
+
+    def handler(method, path, body):
+        hash = path.rsplit("/", 1)[1]
+        fetched.append(hash)
+        if hash not in blobs:
+            return 404, {}, b""
+        return 200, {}, blobs[hash].data
+
+    hashes = list(blobs)
+    with StubServer(handler) as server:
+        cache = BlobCache(MemoryCache(max_bytes=5000), DiskCache(tmp_path))
+        blobstore = BlobStoreClient(base_url=server.base_url, cache=cache)
+        for hash in hashes:
+            assert blobstore.get(hash) == blobs[hash]
+        for hash in hashes:
+            assert blobstore.get(hash).data == blobs[hash].data
+        assert len(fetched) == len(hashes)
+        assert cache.memory.size <= 5000
+        assert len(cache.memory) == 4
+        with pytest.raises(BlobNotFoundError):
+            blobstore.get("0" * 64)
+
+        # Hashes not usable as a cache path go to the server
+        fetched.clear()
+        with pytest.raises(BlobNotFoundError):
+            blobstore.get(hashes[0].upper())
+        assert fetched == [hashes[0].upper()]
+        assert cache.disk.get("../x") is None
+        cache.disk.put("../x", b"x")
+
+        # The disk tier is shared (e.g. by another process)
+        fetched.clear()
+        other = BlobStoreClient(
+            base_url=server.base_url, cache=BlobCache(disk=DiskCache(tmp_path))
+        )
+        assert other.get(hashes[0]).data == blobs[hashes[0]].data
+        assert not fetched
+
+        # Corrupted blobs are fetched again
+        path = tmp_path / "blobs" / hashes[1][:2] / hashes[1]
+        path.write_bytes(b"corrupted")
+        other = BlobStoreClient(
+            base_url=server.base_url, cache=BlobCache(disk=DiskCache(tmp_path))
+        )
+        assert other.get(hashes[1]).data == blobs[hashes[1]].data
+        assert fetched == [hashes[1]]
+        assert path.read_bytes() == blobs[hashes[1]].data
+
+    # The least recently used blobs are evicted
+    disk = DiskCache(tmp_path / "small", max_bytes=10000)
+    for i, hash in enumerate(hashes[:9]):
+        disk.put(hash, blobs[hash].data)
+        os.utime(disk._blob_path(hash), (i, i))
+    assert disk.get(hashes[0]) is not None
+    disk.put(hashes[9], blobs[hashes[9]].data)
+    assert disk.disk_usage() <= 9000
+    assert disk.get(hashes[0]) is not None
+    assert disk.get(hashes[1]) is None
+
+
+def test_blobstore_get_many():
+    blobs = [Blob.from_data(str(i).encode()) for i in range(20)]
+    stored = {blob.hash: blob for blob in blobs}
+    fetched = []
+
+    def handler(method, path, body):
+        time.sleep(0.05)
+        hash = path.rsplit("/", 1)[1]
+        fetched.append(hash)
+        if hash not in stored:
+            return 404, {}, b""
+        return 200, {}, stored[hash].data
+
+    missing = "0" * 64
+    hashes = [blob.hash for blob in blobs]
+    hashes = hashes + [missing] + hashes[:5]
+    with StubServer(handler) as server:
+        blobstore = BlobStoreClient(base_url=server.base_url)
+
+        reported = []
+        start = time.perf_counter()
+        result = list(
+            blobstore.get_many(hashes, concurrency=10, on_missing=reported.append)
+        )
+        assert time.perf_counter() - start < 21 * 0.05 / 2
+        assert result == blobs + blobs[:5]
+        assert reported == [missing]
+        assert sorted(fetched) == sorted(stored.keys() | {missing})
+
+        fetched.clear()
+        result = []
+        with pytest.raises(MissingBlobsError) as excinfo:
+            for blob in blobstore.get_many(hashes, concurrency=4, ordered=False):
+                result.append(blob)
+        assert excinfo.value.hashes == [missing]
+        assert sorted(result, key=lambda blob: blob.hash) == sorted(
+            blobs, key=lambda blob: blob.hash
+        )
+        assert len(fetched) == 21
+
+
+def test_blobstore_streaming(tmp_path):
+    stored = {}
+    encoded = set()
+
+    def handler(method, path, body):
+        if method == "POST":
+            stored.update(_parse_multipart(body))
+            return 200, {}, b""
+        hash = path.rsplit("/", 1)[1]
+        if hash not in stored:
+            return 404, {}, b""
+        if hash in encoded:
+            return 200, {"Content-Encoding": "gzip"}, gzip.compress(stored[hash])
+        return 200, {}, stored[hash]
+
+    data = os.urandom(300 * 1024 + 7)
+    path = tmp_path / "blob"
+    path.write_bytes(data)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        blob = Blob.from_data(mm)
+        assert blob.data is mm
+        assert blob.size == len(data)
+        assert Blob.from_data(memoryview(data)).hash == blob.hash
+
+    with StubServer(handler) as server:
+        blobstore = BlobStoreClient(base_url=server.base_url)
+
+        with open(path, "rb") as f:
+            assert blobstore.put_stream(blob.hash, f) == blob.hash
+        assert stored.pop(blob.hash) == data
+
+        # The hash is computed first for a seekable file
+        assert blobstore.put_stream(None, io.BytesIO(data)) == blob.hash
+        assert stored.pop(blob.hash) == data
+
+        # Chunked upload
+        view = memoryview(data)
+        chunks = (view[i:][:1000] for i in range(0, len(data), 1000))
+        blobstore.put_stream(blob.hash, chunks)
+        assert stored[blob.hash] == data
+
+        with pytest.raises(BlobHashMismatchError) as excinfo:
+            blobstore.put_stream("0" * 64, io.BytesIO(data))
+        assert excinfo.value.actual_hash == blob.hash
+
+        buf = bytearray(len(data) + 10)
+        assert blobstore.get_into(blob.hash, buf) == len(data)
+        assert buf.startswith(data)
+        with pytest.raises(ValueError):
+            blobstore.get_into(blob.hash, bytearray(10))
+
+        out = io.BytesIO()
+        assert blobstore.get_into(blob.hash, out, chunk_size=1000) == len(data)
+        assert out.getvalue() == data
+
+        # Read straight into an exact size buffer
+        buf = bytearray(len(data))
+        assert blobstore.get_into(blob.hash, buf, chunk_size=1000) == len(data)
+        assert buf == data
+        with pytest.raises(ValueError):
+            blobstore.get_into(blob.hash, bytearray(len(data) - 1))
+
+        # Encoded responses are decoded
+        encoded.add(blob.hash)
+        buf = bytearray(len(data))
+        assert blobstore.get_into(blob.hash, buf) == len(data)
+        assert buf == data
+        encoded.clear()
+
+        stored["1" * 64] = data
+        with pytest.raises(BlobHashMismatchError):
+            blobstore.get_into("1" * 64, io.BytesIO())
+        with pytest.raises(BlobNotFoundError):
+            blobstore.get_into("2" * 64, io.BytesIO())
+
+
+def test_blobstore_verify():
+    blobs = [Blob.from_data(os.urandom(1000)) for i in range(50)]
+    blobs.append(Blob.from_data(os.urandom(200 * 1024)))
+    stored = {blob.hash: blob.data for blob in blobs}
+    corrupted = "1" * 64
+    stored[corrupted] = b"corrupted"
+
+    def handler(method, path, body):
+        return 200, {}, stored[path.rsplit("/", 1)[1]]
+
+    with StubServer(handler) as server:
+        verifier = HashVerifier(workers=2, batch_bytes=10000)
+        blobstore = BlobStoreClient(
+            base_url=server.base_url, verify=verifier, cache=BlobCache()
+        )
+        assert blobstore.get(blobs[0].hash) == blobs[0]
+        assert (verifier.blobs, verifier.bytes) == (1, 1000)
+        with pytest.raises(BlobHashMismatchError) as excinfo:
+            blobstore.get(corrupted)
+        assert excinfo.value.hash == corrupted
+        assert verifier.mismatches == 1
+        # Small blobs are hashed in the calling thread, big ones in the pool
+        assert verifier._executor is None
+        assert blobstore.get(blobs[-1].hash) == blobs[-1]
+        assert verifier._executor is not None
+
+        hashes = [blob.hash for blob in blobs]
+        assert list(blobstore.get_many(hashes, concurrency=4)) == blobs
+        # Cached blobs are not verified again
+        assert verifier.blobs == 2 + len(blobs) - 1
+        assert verifier.bytes_per_second > 0
+
+        # The hashing done by `get_into` is recorded too
+        size = verifier.bytes
+        assert blobstore.get_into(blobs[1].hash, io.BytesIO()) == 1000
+        assert (verifier.blobs, verifier.bytes) == (2 + len(blobs), size + 1000)
+        with pytest.raises(BlobHashMismatchError):
+            blobstore.get_into(corrupted, io.BytesIO())
+        assert verifier.mismatches == 2
+
+        with pytest.raises(BlobHashMismatchError):
+            list(blobstore.get_many(hashes[5:] + [corrupted], ordered=False))
+
+        assert BlobStoreClient(client=blobstore._client, verify=True).verifier
+    verifier.close()
+
+
+def test_chunker():
+    chunker = FastCDC(min_size=2048, avg_size=8192, max_size=32768)
+    data = os.urandom(1024 * 1024)
+    chunks = [bytes(chunk) for chunk in chunker.split(data)]
+    assert b"".join(chunks) == data
+    assert all(2048 <= len(chunk) <= 32768 for chunk in chunks[:-1])
+    assert 4096 < len(data) / len(chunks) < 16384
+    # Same cut points when reading a file (whatever the read size)
+    for read_size in [1000, 40000, 100000]:
+        assert [
+            bytes(chunk)
+            for chunk in chunker.split(io.BytesIO(data), read_size=read_size)
+        ] == chunks
+
+    # An edit only changes the chunks around it
+    edited = data[:500000] + b"edit" + data[500100:]
+    edited_chunks = [bytes(chunk) for chunk in chunker.split(edited)]
+    assert len(set(edited_chunks) - set(chunks)) <= 2
+
+    manifest = Manifest([(Blob.from_data(c).hash, len(c)) for c in chunks])
+    decoded = Manifest.decode(manifest.encode())
+    assert decoded.chunks == manifest.chunks
+    assert decoded.size == len(data)
+    assert len(manifest.encode()) < 40 * len(chunks)
+
+    with pytest.raises(ValueError):
+        FastCDC(avg_size=100)
+    with pytest.raises(ValueError):
+        FastCDC(max_size=4 * 1024 * 1024 * 1024)
+
+
+@benchmark
+def test_chunker_benchmark():
+    mbps = bench_chunker(FastCDC(), 8 * 1024 * 1024)
+    print("FastCDC: {:.1f} MB/s".format(mbps))
+    assert mbps > 2
+
+
+def test_blobstore_chunked():
+    stored = {}
+    uploaded = []
+
+    def handler(method, path, body):
+        if method == "POST":
+            parts = _parse_multipart(body)
+            uploaded.extend(hash for hash, _ in parts)
+            stored.update(parts)
+            return 200, {}, b""
+        hash = path.rsplit("/", 1)[1]
+        if hash not in stored:
+            return 404, {}, b""
+        return 200, {}, b"" if method == "HEAD" else stored[hash]
+
+    chunker = FastCDC(min_size=2048, avg_size=8192, max_size=32768)
+    data = os.urandom(512 * 1024)
+    with StubServer(handler) as server:
+        blobstore = BlobStoreClient(base_url=server.base_url, known=set())
+        ref = blobstore.put_chunked(io.BytesIO(data), chunker=chunker)
+        out = io.BytesIO()
+        assert blobstore.get_chunked(ref, out) == len(data)
+        assert out.getvalue() == data
+
+        # Only the edited chunks (and the new manifest) are uploaded
+        edited = data[:100000] + b"edit" + data[100000:]
+        uploaded.clear()
+        ref = blobstore.put_chunked(edited, chunker=chunker, skip_known=True)
+        assert 2 <= len(uploaded) <= 4
+        uploaded.clear()
+        other = BlobStoreClient(base_url=server.base_url)
+        assert other.put_chunked(edited, chunker=chunker, skip_existing=True) == ref
+        assert len(uploaded) == 1
+        out = io.BytesIO()
+        other.get_chunked(ref, out)
+        assert out.getvalue() == edited
+
+        # A Bloom filter false positive doesn't skip a chunk missing on the server
+        stored.clear()
+        uploaded.clear()
+        bloom = BloomFilter(capacity=10)
+        bloom._bits[:] = b"\xff" * len(bloom._bits)
+        other = BlobStoreClient(base_url=server.base_url, known=bloom)
+        ref = other.put_chunked(data, chunker=chunker, skip_existing=True)
+        out = io.BytesIO()
+        assert other.get_chunked(ref, out) == len(data)
+        assert out.getvalue() == data
+
+
+def test_blobstore_inventory():
+    blobs = [Blob.from_data(str(i).encode()) for i in range(250)]
+
+    def handler(method, path, body):
+        query = parse_qs(urlparse(path).query)
+        cursor = int(query.get("cursor", ["0"])[0])
+        page = blobs[cursor:][:100]
+        data = {
+            "data": [{"hash": blob.hash, "size": blob.size} for blob in page],
+            "pagination": {
+                "has_more": cursor + 100 < len(blobs),
+                "cursor": str(cursor + 100),
+                "count": len(page),
+            },
+        }
+        return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+    with StubServer(handler) as server:
+        blobstore = BlobStoreClient(base_url=server.base_url)
+        refs = list(blobstore.iter(compact=True, per_page=100))
+        assert refs == [BlobRef(blob.hash, blob.size) for blob in blobs]
+        assert not hasattr(refs[0], "__dict__")
+        inventory = blobstore.inventory(per_page=100)
+
+    hashes = {blob.hash for blob in blobs}
+    assert len(inventory) == len(blobs)
+    assert set(inventory.hashes()) == hashes
+    assert inventory.total_size == sum(blob.size for blob in blobs)
+    assert blobs[3].hash in inventory
+    assert refs[3].digest in inventory
+    assert inventory.size_of(blobs[3].hash) == blobs[3].size
+    assert "0" * 64 not in inventory
+
+    others = [Blob.from_data(str(i).encode()) for i in range(200, 400)]
+    other = BlobInventory.from_refs(others)
+    other_hashes = {blob.hash for blob in others}
+    assert set((inventory - other).hashes()) == hashes - other_hashes
+    assert set((inventory & other).hashes()) == hashes & other_hashes
+    union = inventory | other
+    assert set(union.hashes()) == hashes | other_hashes
+    assert list(union.hashes()) == sorted(hashes | other_hashes)
+    assert union.size_of(others[-1].hash) == others[-1].size
+
+    # Small inventories are checked with a binary search
+    small = BlobInventory.from_refs(others[:5])
+    assert set((small - inventory).hashes()) == {b.hash for b in others[:5]} - hashes
+    assert (small & inventory) == (inventory & small)
+
+
 def test_blobstore_client():
     """Ensure the BlobStash utils can spawn a server."""
     b = BlobStash()
@@ -121,3 +1296,36 @@ def test_kvstore_client():
         print("done")
         b.shutdown()
         b.cleanup()
+
+
+def test_async_blobstore_client():
+    """Ensure the asyncio client can put/get/iterate blobs."""
+    pytest.importorskip("aiohttp")
+    from blobstash.base.aio import AsyncBlobStoreClient
+
+    async def run():
+        client = AsyncBlobStoreClient(api_key="123")
+        try:
+            with pytest.raises(BlobNotFoundError):
+                await client.get("0" * 64)
+
+            blobs = [Blob.from_data(os.urandom(1024)) for _ in range(50)]
+            await asyncio.gather(*[client.put(blob) for blob in blobs])
+
+            fetched = await asyncio.gather(*[client.get(blob.hash) for blob in blobs])
+            for blob, fetched_blob in zip(blobs, fetched):
+                assert fetched_blob.data == blob.data
+
+            hashes = [blob.hash async for blob in client.iter(per_page=10)]
+            assert sorted(hashes) == sorted(blob.hash for blob in blobs)
+        finally:
+            await client.close()
+
+    b = BlobStash()
+    b.cleanup()
+    try:
+        b.run()
+        asyncio.run(run())
+    finally:
+        b.shutdown()
+        b.cleanup()
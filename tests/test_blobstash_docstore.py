@@ -1,5 +1,21 @@
+import json
+
+import pytest
+
+from blobstash.base.codec import OrjsonCodec
+from blobstash.base.codec import StdlibCodec
+from blobstash.base.test_utils import BENCH
+from blobstash.base.test_utils import BENCH_ITEMS
+from blobstash.base.test_utils import BENCH_PER_PAGE
 from blobstash.base.test_utils import BlobStash
+from blobstash.base.test_utils import FakePaginatedClient
+from blobstash.base.test_utils import bench_scan
+from blobstash.base.test_utils import StubServer
 from blobstash.docstore import DocStoreClient, Q
+from blobstash.docstore import Collection
+from blobstash.docstore import DocsQueryIterator
+from blobstash.docstore import JSONEncoder
+from blobstash.docstore.attachment import Attachment
 
 
 def test_docstore():
@@ -47,3 +63,134 @@ def test_docstore():
     finally:
         b.shutdown()
         b.cleanup()
+
+
+class _SubAttachment(Attachment):
+    pass
+
+
+@pytest.mark.parametrize(
+    "codec", [StdlibCodec(), StdlibCodec(JSONEncoder), OrjsonCodec()]
+)
+def test_codec(codec):
+    doc = {"a": [1, 2.5, None, True], "b": {"c": "é"}, 1: "int key"}
+    doc["file"] = Attachment("@filetree/ref:abc", None)
+    doc["sub"] = _SubAttachment("@filetree/ref:def", None)
+    assert codec.loads(codec.dumps(doc)) == {
+        "a": [1, 2.5, None, True],
+        "b": {"c": "é"},
+        "1": "int key",
+        "file": "@filetree/ref:abc",
+        "sub": "@filetree/ref:def",
+    }
+
+
+def test_collection_get_fetches_one_doc():
+    client = FakePaginatedClient([{"_id": "abc", "v": 1}], 100)
+    assert Collection(client, "col").get()["v"] == 1
+    assert client.limits == [1]
+
+
+def test_docstore_query_checkpoint(tmp_path):
+    client = FakePaginatedClient([{"_id": "abc", "v": 1}], 100)
+    col = Collection(client, "col")
+    path = tmp_path / "query.checkpoint"
+    for i, doc in enumerate(col.query(Q["v"] == 1, per_page=10, checkpoint=path)):
+        if i == 25:
+            break
+
+    # Resuming needs the same query
+    assert len(list(col.query(Q["v"] == 1, per_page=10, resume_from=path))) == 80
+    with pytest.raises(ValueError):
+        col.query(Q["v"] == 2, per_page=10, resume_from=path)
+
+
+def test_docstore_insert_attachment_pointer():
+    bodies = []
+
+    def handler(method, path, body):
+        bodies.append(json.loads(body))
+        resp = {"_id": "abc", "_version": "1", "_created": "2020-01-01T00:00:00Z"}
+        return 200, {"Content-Type": "application/json"}, json.dumps(resp).encode()
+
+    with StubServer(handler) as server:
+        client = DocStoreClient(base_url=server.base_url)
+        attachment = Attachment("@filetree/ref:abc", None)
+        _id = client.col.insert({"file": attachment, "files": [attachment]})
+        assert _id.id() == "abc"
+
+    assert bodies == [{"file": "@filetree/ref:abc", "files": ["@filetree/ref:abc"]}]
+
+
+def test_docstore_query_stream():
+    pointer = "@filetree/ref:abc"
+    node = {"name": "a.txt", "ref": "abc", "type": "file", "size": 1}
+
+    def handler(method, path, body):
+        docs = [
+            {"_id": "id{}".format(i), "_version": "1", "file": pointer, "n": i}
+            for i in range(50)
+        ]
+        # Keys are sorted like the server does, the pointers come after the docs
+        resp = {
+            "data": docs,
+            "pagination": {"has_more": False, "cursor": "", "count": len(docs)},
+            "pointers": {pointer: node},
+        }
+        return 200, {"Content-Type": "application/json"}, json.dumps(resp).encode()
+
+    with StubServer(handler) as server:
+        col = DocStoreClient(base_url=server.base_url).col
+        docs = list(col.query(stream=True))
+        assert [doc["_id"] for doc in docs] == [doc["_id"] for doc in col.query()]
+
+    assert [doc["n"] for doc in docs] == list(range(50))
+    assert docs[0]["_id"].id() == "id0"
+    assert isinstance(docs[0]["file"], Attachment)
+    assert docs[0]["file"].node.ref == "abc"
+
+
+@pytest.mark.skipif(not BENCH, reason="set BLOBSTASH_BENCH=1 to run")
+def test_docstore_query_prefetch_benchmark():
+    docs = [
+        {"_id": "{:024x}".format(i), "_version": "1", "title": "doc", "n": i}
+        for i in range(1000)
+    ]
+    results = bench_scan(
+        lambda client, prefetch: DocsQueryIterator(
+            client,
+            Collection(client, "col"),
+            None,
+            per_page=BENCH_PER_PAGE,
+            prefetch=prefetch,
+        ),
+        docs,
+    )
+    print(
+        "DocsQueryIterator x{}: {:.0f} docs/s, {:.0f} docs/s with prefetch".format(
+            BENCH_ITEMS, results[0], results[2]
+        )
+    )
+    # Parsing the docs dominates, only the latency is hidden
+    assert results[2] > results[0]
+
+
+def test_docstore_query_per_page():
+    paths = []
+
+    def handler(method, path, body):
+        paths.append(path)
+        resp = {
+            "data": [],
+            "pagination": {"has_more": False, "cursor": "", "count": 0},
+            "pointers": {},
+        }
+        return 200, {"Content-Type": "application/json"}, json.dumps(resp).encode()
+
+    with StubServer(handler) as server:
+        col = DocStoreClient(base_url=server.base_url).col
+        assert list(col.query(per_page=7, limit=100)) == []
+        assert list(col.query(per_page=70, limit=10)) == []
+
+    assert "limit=7" in paths[0]
+    assert "limit=10" in paths[1]
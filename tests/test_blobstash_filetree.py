@@ -1,3 +1,4 @@
+import asyncio
 import io
 import os
 import shutil
@@ -135,3 +136,35 @@ def test_filetree_fs():
     finally:
         b.shutdown()
         b.cleanup()
+
+
+def test_async_filetree_node_stream():
+    pytest.importorskip("aiohttp")
+    from blobstash.filetree.aio import AsyncFileTreeClient
+
+    async def chunks():
+        for _ in range(10):
+            yield b"Hello world\n"
+
+    async def run():
+        client = AsyncFileTreeClient(api_key="123")
+        try:
+            node = await client.fput_node("hello.txt", chunks())
+            assert node.size == 120
+
+            out = b""
+            async with await client.fget_node(node) as reader:
+                async for chunk in reader:
+                    out += chunk
+            assert out == b"Hello world\n" * 10
+        finally:
+            await client.close()
+
+    b = BlobStash()
+    b.cleanup()
+    try:
+        b.run()
+        asyncio.run(run())
+    finally:
+        b.shutdown()
+        b.cleanup()